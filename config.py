@@ -19,6 +19,31 @@ class Config:
     # File Upload Configuration
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'uploads'
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16777216))  # 16MB
+    BLOB_FOLDER = os.environ.get('BLOB_FOLDER')  # directory or S3 key prefix of the content-addressed store (default UPLOAD_FOLDER/blobs, or blobs on S3)
+    BLOB_GC_GRACE_PERIOD = int(os.environ.get('BLOB_GC_GRACE_PERIOD', 86400))  # seconds an unreferenced blob is kept
+    BLOB_GC_INTERVAL = int(os.environ.get('BLOB_GC_INTERVAL', 3600))  # seconds between garbage collection runs (0 = not scheduled)
+    # Resumable uploads: files up to MAX_UPLOAD_SIZE are sent in chunks that each fit MAX_CONTENT_LENGTH
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8388608))  # 8MB
+    MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 536870912))  # 512MB
+    UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', 86400))  # seconds an idle upload session is kept
+    UPLOAD_SESSION_EXPIRY_INTERVAL = int(os.environ.get('UPLOAD_SESSION_EXPIRY_INTERVAL', 3600))  # seconds between sweeps of expired upload sessions (0 = not scheduled)
+    INTEGRITY_CHECK_WORKERS = int(os.environ.get('INTEGRITY_CHECK_WORKERS', 4))  # threads hashing files during an integrity check
+    MERKLE_CHUNK_SIZE = int(os.environ.get('MERKLE_CHUNK_SIZE', 1048576))  # 1MB chunks in the Merkle tree of each document
+    MERKLE_WORKERS = int(os.environ.get('MERKLE_WORKERS', 0))  # threads hashing chunks (0 = one per CPU)
+    VERIFY_DOWNLOAD_CHUNKS = os.environ.get('VERIFY_DOWNLOAD_CHUNKS', 'false').lower() == 'true'  # check served byte ranges against the Merkle tree
+    SCRUB_TIME_LIMIT = int(os.environ.get('SCRUB_TIME_LIMIT', 600))  # seconds each integrity scrub run may take
+    SCRUB_MAX_BYTES_PER_SECOND = int(os.environ.get('SCRUB_MAX_BYTES_PER_SECOND', 20971520))  # 20MB/s read limit of the scrubber (0 = unlimited)
+    SCRUB_INTERVAL = int(os.environ.get('SCRUB_INTERVAL', 3600))  # seconds between integrity scrub runs (0 = not scheduled)
+    VERIFY_CACHE_TTL = int(os.environ.get('VERIFY_CACHE_TTL', 300))  # seconds a public verification result is reused (0 = off)
+    VERIFY_CACHE_BACKEND = os.environ.get('VERIFY_CACHE_BACKEND', 'memory')  # 'memory' (per worker process, starts cold in each) or 'redis' (shared through REDIS_URL)
+    
+    # Document storage backend: 'local' (UPLOAD_FOLDER) or 's3' (any S3-compatible endpoint, e.g. MinIO)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # e.g. http://localhost:9000 for MinIO
+    S3_REGION = os.environ.get('S3_REGION')
+    S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID')
+    S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY')
     
     # Email Configuration
     SENDGRID_API_KEY = os.environ.get('SENDGRID_API_KEY')
@@ -40,12 +65,50 @@ class Config:
     # Redis Configuration
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
     
+    # PDF Signing Configuration
+    PDF_INCREMENTAL_SIGNING = os.environ.get('PDF_INCREMENTAL_SIGNING', 'false').lower() == 'true'
+    PDF_LINEARIZE_SIGNED = os.environ.get('PDF_LINEARIZE_SIGNED', 'false').lower() == 'true'  # fast web view, ignored with incremental signing
+    ASYNC_SIGNING = os.environ.get('ASYNC_SIGNING', 'false').lower() == 'true'
+    SIGNING_JOB_TIMEOUT = int(os.environ.get('SIGNING_JOB_TIMEOUT', 600))  # seconds a signing job may wait in the queue, and then run
+    CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', 'false').lower() == 'true'
+    
+    # PDF process pool (0 workers runs PDF work in the request thread)
+    PDF_POOL_SIZE = int(os.environ.get('PDF_POOL_SIZE', 0))
+    PDF_POOL_QUEUE_DEPTH = int(os.environ.get('PDF_POOL_QUEUE_DEPTH', 16))
+    PDF_POOL_TASK_TIMEOUT = int(os.environ.get('PDF_POOL_TASK_TIMEOUT', 60))  # seconds
+    PDF_POOL_QUEUE_TIMEOUT = int(os.environ.get('PDF_POOL_QUEUE_TIMEOUT', 5))  # seconds
+    
+    # Watermark drawn on draft previews (?draft=true)
+    DRAFT_WATERMARK_TEXT = os.environ.get('DRAFT_WATERMARK_TEXT', 'DRAFT')
+    
+    # DOCX to PDF conversion (0 workers starts a one-shot soffice per conversion)
+    DOCX_CONVERTER_POOL_SIZE = int(os.environ.get('DOCX_CONVERTER_POOL_SIZE', 0))
+    DOCX_CONVERTER_MAX_JOBS = int(os.environ.get('DOCX_CONVERTER_MAX_JOBS', 200))  # conversions before a worker is recycled
+    DOCX_CONVERTER_TIMEOUT = int(os.environ.get('DOCX_CONVERTER_TIMEOUT', 60))  # seconds
+    DOCX_CONVERTER_QUEUE_TIMEOUT = int(os.environ.get('DOCX_CONVERTER_QUEUE_TIMEOUT', 30))  # seconds
+    DOCX_CONVERTER_STARTUP_TIMEOUT = int(os.environ.get('DOCX_CONVERTER_STARTUP_TIMEOUT', 30))  # seconds
+    DOCX_CONVERSION_CACHE_FOLDER = os.environ.get('DOCX_CONVERSION_CACHE_FOLDER')
+    DOCX_CONVERSION_CACHE_MAX_AGE = int(os.environ.get('DOCX_CONVERSION_CACHE_MAX_AGE', 604800))  # seconds a cached conversion is kept unused
+    DOCX_CONVERSION_CACHE_MAX_BYTES = int(os.environ.get('DOCX_CONVERSION_CACHE_MAX_BYTES', 1073741824))  # 1GB (0 = no size limit)
+    DOCX_CONVERSION_CACHE_EXPIRY_INTERVAL = int(os.environ.get('DOCX_CONVERSION_CACHE_EXPIRY_INTERVAL', 86400))  # seconds between conversion cache trims (0 = not scheduled)
+    SOFFICE_COMMAND = os.environ.get('SOFFICE_COMMAND', 'soffice')
+    UNOSERVER_COMMAND = os.environ.get('UNOSERVER_COMMAND', 'unoserver')
+    UNOCONVERT_COMMAND = os.environ.get('UNOCONVERT_COMMAND', 'unoconvert')
+    
     # Application Settings
     FREE_DOCUMENTS_LIMIT = 5
     
     @staticmethod
     def init_app(app):
-        pass
+        # Background jobs and the beat schedule of the maintenance tasks
+        from src.tasks import init_celery
+        init_celery(app)
+
+        if app.config.get('PDF_INCREMENTAL_SIGNING') and app.config.get('PDF_LINEARIZE_SIGNED'):
+            app.logger.warning(
+                "PDF_LINEARIZE_SIGNED is ignored with PDF_INCREMENTAL_SIGNING: "
+                "linearizing would rewrite the incrementally signed PDFs"
+            )
 
 class DevelopmentConfig(Config):
     DEBUG = True
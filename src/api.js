@@ -91,7 +91,23 @@ export const documentsAPI = {
   previewDocument: (id) => api.get(`/documents/${id}/preview`, {
     responseType: 'blob',
   }),
+  getPagePreview: (id, page = 1, size = 'thumbnail') => api.get(`/documents/${id}/pages/${page}/preview`, {
+    params: { size },
+    responseType: 'blob',
+  }),
   addDocumentFields: (id, data) => api.post(`/documents/${id}/fields`, data),
+  updateDocumentFields: (id, data) => api.patch(`/documents/${id}/fields`, data),
+  // Resumable uploads for files larger than a single request allows
+  createUpload: (filename, size) => api.post('/uploads', { filename, size }),
+  getUpload: (uploadId) => api.get(`/uploads/${uploadId}`),
+  uploadChunk: (uploadId, offset, chunk, totalSize) => api.put(`/uploads/${uploadId}`, chunk, {
+    headers: {
+      'Content-Type': 'application/octet-stream',
+      'Content-Range': `bytes ${offset}-${offset + chunk.size - 1}/${totalSize}`,
+    },
+  }),
+  completeUpload: (uploadId) => api.post(`/uploads/${uploadId}/complete`),
+  abortUpload: (uploadId) => api.delete(`/uploads/${uploadId}`),
 };
 
 // Signatures API
@@ -1,6 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event, func, literal_column
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import uuid
 
 db = SQLAlchemy()
 
@@ -31,17 +33,18 @@ class User(db.Model):
             return False
         return check_password_hash(self.password_hash, password)
 
-    def can_sign_document(self):
+    def can_sign_document(self, count=1):
         """Check if user can sign more documents (freemium logic)"""
         from config import Config
         if self.is_admin:
             return True
-        return self.free_documents_signed < Config.FREE_DOCUMENTS_LIMIT
+        return self.free_documents_signed + count <= Config.FREE_DOCUMENTS_LIMIT
 
-    def increment_signed_documents(self):
+    def increment_signed_documents(self, count=1, commit=True):
         """Increment the count of signed documents"""
-        self.free_documents_signed += 1
-        db.session.commit()
+        self.free_documents_signed += count
+        if commit:
+            db.session.commit()
 
     def to_dict(self):
         return {
@@ -68,6 +71,22 @@ class Document(db.Model):
     signed_path = db.Column(db.String(255), nullable=True)
     status = db.Column(db.Enum('uploaded', 'pending', 'signed', 'rejected', name='document_status'), default='uploaded')
     sha256_hash = db.Column(db.String(64), nullable=True)
+    
+    # PDF metadata extracted once at upload
+    page_count = db.Column(db.Integer, nullable=True)
+    pdf_version = db.Column(db.String(8), nullable=True)
+    is_encrypted = db.Column(db.Boolean, nullable=True)
+    # Large JSON columns are deferred so listing documents does not load them
+    page_geometry = db.deferred(db.Column(db.JSON, nullable=True))  # [[llx, lly, urx, ury, rotation], ...] per page
+    signed_linearized = db.Column(db.Boolean, nullable=True)  # signed PDF saved for fast web view
+    fields_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # bumped on every field layout save
+    verification_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # bumped when signing or cancelling changes what public verification shows
+    
+    # Merkle tree over fixed-size chunks of the file sha256_hash refers to
+    merkle_root = db.Column(db.String(64), nullable=True)
+    merkle_chunk_size = db.Column(db.Integer, nullable=True)
+    merkle_leaves = db.deferred(db.Column(db.JSON, nullable=True))  # hex digest per chunk
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -85,19 +104,92 @@ class Document(db.Model):
             'signed_path': self.signed_path,
             'status': self.status,
             'sha256_hash': self.sha256_hash,
+            'page_count': self.page_count,
+            'pdf_version': self.pdf_version,
+            'is_encrypted': self.is_encrypted,
+            'signed_linearized': self.signed_linearized,
+            'fields_version': self.fields_version,
+            'merkle_root': self.merkle_root,
+            'merkle_chunk_size': self.merkle_chunk_size,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+    def set_geometry(self, geometry):
+        """Store the record returned by pdf_utils.extract_pdf_geometry
+
+        None (an unparseable PDF) is stored as an empty page list, so the
+        failed extraction is not retried on every request.
+        """
+        if geometry is None:
+            self.page_geometry = []
+            return
+        self.page_count = geometry['page_count']
+        self.pdf_version = geometry['pdf_version']
+        self.is_encrypted = geometry['is_encrypted']
+        self.page_geometry = geometry['pages']
+
+    @property
+    def geometry_extracted(self):
+        """Whether page geometry extraction has run, including for encrypted or unparseable PDFs"""
+        # is_encrypted is checked first so the deferred geometry is only loaded when needed
+        return self.is_encrypted is not None or self.page_geometry is not None
+
+    def set_merkle_tree(self, tree):
+        """Store a tree from hashing.MerkleTreeBuilder or sha256_file_with_tree, or clear it with None"""
+        self.merkle_root = tree['root'] if tree else None
+        self.merkle_chunk_size = tree['chunk_size'] if tree else None
+        self.merkle_leaves = tree['leaves'] if tree else None
+
+    def bump_verification_version(self):
+        """Invalidate cached public verification results of this document"""
+        self.verification_version = (self.verification_version or 0) + 1
+
+    def page_size(self, page_number):
+        """Return (width, height) of a 1-based page from the stored geometry, if known"""
+        if not self.page_geometry or not 1 <= page_number <= len(self.page_geometry):
+            return None
+        llx, lly, urx, ury, rotation = self.page_geometry[page_number - 1]
+        return (urx - llx, ury - lly)
+
     def __repr__(self):
         return f'<Document {self.filename}>'
 
 
+class SignatureEnvelope(db.Model):
+    __tablename__ = 'signature_envelopes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    signer_email = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.Enum('pending', 'signed', 'rejected', name='envelope_status'), default='pending')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    signed_at = db.Column(db.DateTime, nullable=True)
+    
+    # Relationships
+    signature_requests = db.relationship('SignatureRequest', backref='envelope', lazy=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'signer_email': self.signer_email,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'signed_at': self.signed_at.isoformat() if self.signed_at else None,
+            'signature_requests': [req.to_dict() for req in self.signature_requests]
+        }
+
+    def __repr__(self):
+        return f'<SignatureEnvelope {self.id} for {self.signer_email}>'
+
+
 class SignatureRequest(db.Model):
     __tablename__ = 'signature_requests'
     
     id = db.Column(db.Integer, primary_key=True)
     document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False)
+    envelope_id = db.Column(db.Integer, db.ForeignKey('signature_envelopes.id'), nullable=True)
     signer_email = db.Column(db.String(255), nullable=False)
     status = db.Column(db.Enum('pending', 'signed', 'rejected', name='signature_status'), default='pending')
     signature_type = db.Column(db.Enum('electronic', 'digital', name='signature_type'), nullable=False)
@@ -106,11 +198,14 @@ class SignatureRequest(db.Model):
     ip_address = db.Column(db.String(45), nullable=True)
     geolocation = db.Column(db.String(255), nullable=True)
     biometric_data_placeholder = db.Column(db.Text, nullable=True)
+    signing_job_id = db.Column(db.String(36), nullable=True, index=True)
+    signing_job_queued_at = db.Column(db.DateTime, nullable=True)
 
     def to_dict(self):
         return {
             'id': self.id,
             'document_id': self.document_id,
+            'envelope_id': self.envelope_id,
             'signer_email': self.signer_email,
             'status': self.status,
             'signature_type': self.signature_type,
@@ -126,9 +221,13 @@ class SignatureRequest(db.Model):
 
 class DocumentField(db.Model):
     __tablename__ = 'document_fields'
+    __table_args__ = (
+        db.UniqueConstraint('document_id', 'client_id', name='uq_document_fields_client_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False)
+    client_id = db.Column(db.String(64), nullable=True)  # stable id assigned by the editor
     field_type = db.Column(db.Enum('signature', 'date', 'full_name', 'checkbox', name='field_type'), nullable=False)
     page_number = db.Column(db.Integer, nullable=False)
     x_coord = db.Column(db.Numeric(10, 2), nullable=False)
@@ -139,6 +238,7 @@ class DocumentField(db.Model):
     def to_dict(self):
         return {
             'id': self.id,
+            'client_id': self.client_id,
             'document_id': self.document_id,
             'field_type': self.field_type,
             'page_number': self.page_number,
@@ -152,6 +252,129 @@ class DocumentField(db.Model):
         return f'<DocumentField {self.field_type} at ({self.x_coord}, {self.y_coord})>'
 
 
+def page_search_vector(content):
+    """tsvector of normalized page text; must match the expression of the PostgreSQL GIN index"""
+    return func.to_tsvector(literal_column("'simple'::regconfig"), content)
+
+
+class DocumentPage(db.Model):
+    """Normalized text of a document page, searched with the database's full-text index
+
+    PostgreSQL matches it through a GIN index on its tsvector and SQLite
+    through the ``document_pages_fts`` FTS5 table kept in sync by triggers,
+    which also indexes the owner so a search never walks other tenants' pages.
+    """
+    __tablename__ = 'document_pages'
+    __table_args__ = (
+        db.Index('ix_document_pages_user_document', 'user_id', 'document_id'),
+        db.Index(
+            'ix_document_pages_search', db.text("to_tsvector('simple'::regconfig, content)"),
+            postgresql_using='gin'
+        ).ddl_if(dialect='postgresql'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)  # owner of the document
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False, index=True)
+    page_number = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.Text, nullable=False)  # lowercase, accent-free terms without stopwords
+
+    def __repr__(self):
+        return f'<DocumentPage {self.page_number} of Document {self.document_id}>'
+
+
+for statement in (
+    "CREATE VIRTUAL TABLE document_pages_fts USING fts5(content, user_id, content='document_pages', content_rowid='id')",
+    "CREATE TRIGGER document_pages_fts_insert AFTER INSERT ON document_pages BEGIN "
+    "INSERT INTO document_pages_fts(rowid, content, user_id) VALUES (new.id, new.content, new.user_id); END",
+    "CREATE TRIGGER document_pages_fts_delete AFTER DELETE ON document_pages BEGIN "
+    "INSERT INTO document_pages_fts(document_pages_fts, rowid, content, user_id) "
+    "VALUES ('delete', old.id, old.content, old.user_id); END",
+):
+    event.listen(DocumentPage.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(DocumentPage.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS document_pages_fts").execute_if(dialect='sqlite'))
+
+
+class DocumentTerm(db.Model):
+    """Inverted index entry: occurrences of a normalized term on a document page
+
+    Only used on databases without a supported full-text index (see DocumentPage).
+    """
+    __tablename__ = 'document_terms'
+    __table_args__ = (
+        # Searches only read the postings of one tenant
+        db.Index('ix_document_terms_user_term_document', 'user_id', 'term', 'document_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)  # owner of the document
+    term = db.Column(db.String(64), nullable=False)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False, index=True)
+    page_number = db.Column(db.Integer, nullable=False)
+    occurrences = db.Column(db.Integer, nullable=False, default=1)
+
+    def __repr__(self):
+        return f'<DocumentTerm {self.term} in Document {self.document_id} page {self.page_number}>'
+
+
+class UploadSession(db.Model):
+    """Resumable upload assembled from chunks before it becomes a Document"""
+    __tablename__ = 'upload_sessions'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received_size = db.Column(db.BigInteger, nullable=False, default=0)
+    parts = db.Column(db.JSON, nullable=True)  # [[offset, length], ...] of chunks staged in S3
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='SET NULL'), nullable=True)  # set once finalized
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'total_size': self.total_size,
+            'received_size': self.received_size,
+            'document_id': self.document_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+
+    def __repr__(self):
+        return f'<UploadSession {self.id} {self.received_size}/{self.total_size}>'
+
+
+class Blob(db.Model):
+    """Content-addressed file shared by every document path that points to it"""
+    __tablename__ = 'blobs'
+    
+    sha256_hash = db.Column(db.String(64), primary_key=True)
+    path = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # original_path/signed_path references
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    released_at = db.Column(db.DateTime, nullable=True, index=True)  # when ref_count last dropped to 0
+
+    def __repr__(self):
+        return f'<Blob {self.sha256_hash} refs={self.ref_count}>'
+
+
+class FileHash(db.Model):
+    """Cached SHA-256 of a stored file, valid while its size and modification time are unchanged"""
+    __tablename__ = 'file_hashes'
+    
+    key = db.Column(db.String(512), primary_key=True)  # storage key
+    size = db.Column(db.BigInteger, nullable=False)
+    mtime_ns = db.Column(db.BigInteger, nullable=False)
+    sha256_hash = db.Column(db.String(64), nullable=False)
+    hashed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<FileHash {self.key}>'
+
+
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
     
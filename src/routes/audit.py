@@ -1,8 +1,10 @@
-from flask import Blueprint, request, jsonify, current_app
+import json
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.user import User, Document, AuditLog, SignatureRequest, db
 from datetime import datetime, timedelta
 from sqlalchemy import and_, or_, desc
+from src.utils.integrity import empty_integrity_summary, integrity_check_query, iter_integrity_results, summarize_integrity_result
 
 audit_bp = Blueprint('audit', __name__)
 
@@ -407,7 +409,13 @@ def get_document_timeline(document_id):
 @audit_bp.route('/audit/integrity-check', methods=['POST'])
 @jwt_required()
 def integrity_check():
-    """Perform integrity check on documents"""
+    """Perform integrity check on documents
+    
+    Files are hashed on a thread pool. Clients accepting
+    application/x-ndjson get one line per document as soon as it is
+    checked, between a leading line with the number of documents and a
+    closing summary line.
+    """
     try:
         current_user_id = get_jwt_identity()
         user = User.query.get(current_user_id)
@@ -415,76 +423,54 @@ def integrity_check():
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        data = request.get_json()
+        data = request.get_json(silent=True)
         document_ids = data.get('document_ids', []) if data else []
+        # Files are re-read unless the caller opts into trusting cached digests of unchanged files
+        deep = bool(data.get('deep')) if data else False
+        quick = bool(data.get('quick')) if data else False
         
-        # If no specific documents provided, check all user's documents
-        if not document_ids:
-            if user.is_admin:
-                documents = Document.query.filter(Document.signed_path.isnot(None)).all()
-            else:
-                documents = Document.query.filter_by(user_id=current_user_id).filter(Document.signed_path.isnot(None)).all()
-        else:
-            if user.is_admin:
-                documents = Document.query.filter(Document.id.in_(document_ids)).all()
-            else:
-                documents = Document.query.filter(
-                    and_(Document.id.in_(document_ids), Document.user_id == current_user_id)
-                ).all()
-        
-        results = []
-        
-        for document in documents:
-            result = {
-                'document_id': document.id,
-                'filename': document.filename,
-                'status': document.status,
-                'stored_hash': document.sha256_hash,
-                'current_hash': None,
-                'integrity_valid': False,
-                'file_exists': False,
-                'error': None
-            }
-            
-            try:
-                # Check if signed file exists
-                if document.signed_path and os.path.exists(document.signed_path):
-                    result['file_exists'] = True
-                    
-                    # Calculate current hash
-                    from src.utils.security import calculate_sha256
-                    current_hash = calculate_sha256(document.signed_path)
-                    result['current_hash'] = current_hash
-                    
-                    # Compare hashes
-                    if current_hash and document.sha256_hash:
-                        result['integrity_valid'] = (current_hash == document.sha256_hash)
-                    
-                else:
-                    result['error'] = 'Signed file not found'
-                
-            except Exception as e:
-                result['error'] = str(e)
-            
-            results.append(result)
+        # If no specific documents provided, check all user's signed documents
+        query = integrity_check_query(document_ids, user_id=None if user.is_admin else current_user_id)
+        total = query.order_by(None).count()
         
         # Log integrity check
         from src.routes.auth import log_action
         log_action(
             'integrity_check_performed',
             user_id=current_user_id,
-            details=f'Integrity check on {len(results)} documents',
+            details=f'Integrity check on {total} documents',
             ip_address=request.remote_addr
         )
         
+        if request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson':
+            def generate():
+                summary = empty_integrity_summary()
+                yield json.dumps({'type': 'summary', 'total': total}) + '\n'
+                try:
+                    for result in iter_integrity_results(query, deep, quick):
+                        summarize_integrity_result(summary, result)
+                        yield json.dumps(dict(result, type='result')) + '\n'
+                except Exception as e:
+                    current_app.logger.error(f"Integrity check error: {str(e)}")
+                    yield json.dumps({'type': 'error', 'error': 'Internal server error'}) + '\n'
+                    return
+                yield json.dumps(dict(summary, type='summary', total=total, complete=True)) + '\n'
+            
+            response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+            # Ask proxies not to buffer, so lines reach the client as they are produced
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
+        
+        summary = empty_integrity_summary()
+        results = []
+        for result in iter_integrity_results(query, deep, quick):
+            summarize_integrity_result(summary, result)
+            results.append(result)
+        results.sort(key=lambda result: result['document_id'])
+        
         return jsonify({
             'results': results,
-            'summary': {
-                'total_checked': len(results),
-                'valid': sum(1 for r in results if r['integrity_valid']),
-                'invalid': sum(1 for r in results if not r['integrity_valid'] and r['file_exists']),
-                'missing_files': sum(1 for r in results if not r['file_exists'])
-            }
+            'summary': summary
         }), 200
         
     except Exception as e:
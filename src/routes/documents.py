@@ -1,12 +1,24 @@
 import os
 import uuid
-import hashlib
-from datetime import datetime
-from flask import Blueprint, request, jsonify, current_app, send_file
+from datetime import datetime, timezone
+from contextlib import ExitStack
+from flask import Blueprint, request, jsonify, current_app, send_file, make_response, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.http import parse_content_range_header
 from werkzeug.utils import secure_filename
-from src.models.user import User, Document, DocumentField, db
+from src.models.user import User, Document, DocumentField, AuditLog, UploadSession, db
 from src.routes.auth import log_action
+from src.utils.pdf_utils import draft_pdf_stream, extract_pdf_geometry
+from src.utils.blob_store import blob_hash, release_blob, store_blob
+from src.utils.chunked_upload import ChunkError, append_chunk, create_upload_session, discard_upload, finish_upload, session_expiry
+from src.utils.docx_converter import convert_docx_to_pdf
+from src.utils.field_layout import MAX_CLIENT_ID_LENGTH, LayoutConflict, normalize_field, save_field_layout
+from src.utils.hashing import chunks_for_range, find_corrupt_chunks, sha256_file_with_tree
+from src.utils.ingest import EXTENSION_MIME_TYPES, ingest_upload
+from src.utils.search import index_document, matching_document_ids, remove_document_index, search_documents
+from src.utils.preview import PREVIEW_SIZES, preview_path, previews_available, remove_previews, render_page_preview
+from src.utils.storage import get_storage
+from sqlalchemy import or_
 
 documents_bp = Blueprint('documents', __name__)
 
@@ -17,22 +29,6 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_file_type(file_path):
-    """Get file MIME type"""
-    try:
-        mime = magic.Magic(mime=True)
-        return mime.from_file(file_path)
-    except:
-        return None
-
-def calculate_file_hash(file_path):
-    """Calculate SHA-256 hash of file"""
-    hash_sha256 = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_sha256.update(chunk)
-    return hash_sha256.hexdigest()
-
 def log_action(action_type, user_id=None, document_id=None, details=None, ip_address=None):
     """Log user actions for audit trail"""
     log = AuditLog(
@@ -45,23 +41,197 @@ def log_action(action_type, user_id=None, document_id=None, details=None, ip_add
     db.session.add(log)
     db.session.commit()
 
-def convert_docx_to_pdf(docx_path, pdf_path):
-    """Convert DOCX to PDF (placeholder implementation)"""
-    try:
-        # This is a placeholder implementation
-        # In production, you would use a library like python-docx + reportlab
-        # or a service like LibreOffice headless mode
-        
-        # For now, we'll just copy the file and rename it
-        # This is NOT a real conversion - just for demonstration
-        import shutil
-        shutil.copy2(docx_path, pdf_path)
-        
-        current_app.logger.warning(f"DOCX to PDF conversion is not implemented. File copied: {docx_path} -> {pdf_path}")
-        return True
-    except Exception as e:
-        current_app.logger.error(f"DOCX to PDF conversion error: {str(e)}")
+def load_document_geometry(document):
+    """Return the stored page geometry, extracting it once for documents uploaded before it was recorded"""
+    storage = get_storage()
+    if not document.geometry_extracted and document.original_path.lower().endswith('.pdf') and storage.exists(document.original_path):
+        with storage.local_copy(document.original_path) as pdf_path:
+            document.set_geometry(extract_pdf_geometry(pdf_path))
+        db.session.commit()
+    # Encrypted and unparseable PDFs have no usable geometry
+    return document.page_geometry or None
+
+def document_etag(document, file_path):
+    """Strong ETag for a stored document file, derived from its SHA-256"""
+    if not document.sha256_hash:
+        return None
+    if file_path == document.signed_path or not document.signed_path:
+        return document.sha256_hash
+    # The stored hash belongs to the signed file; the original never changes after upload
+    return f"{document.sha256_hash}-original"
+
+def preview_key(document):
+    """Cache key of the page previews, which are always rendered from the original file
+
+    sha256_hash moves to the signed file on signing, so it cannot key
+    previews of the original. Stored originals are keyed by their content
+    hash; older files outside the blob store fall back to the ETag scheme.
+    """
+    return blob_hash(document.original_path) or document_etag(document, document.original_path)
+
+def not_modified(etag, last_modified):
+    """Evaluate If-None-Match / If-Modified-Since without touching the file"""
+    if request.if_none_match:
+        return bool(etag) and request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= request.if_modified_since
+    return False
+
+def corrupt_served_chunks(document, file_path):
+    """Check the chunks of a file about to be served against the document's Merkle tree
+    
+    Only the chunks covering the requested byte range are read. Returns the
+    corrupt chunk indexes; empty when VERIFY_DOWNLOAD_CHUNKS is off or the
+    file has no tree.
+    """
+    if not current_app.config.get('VERIFY_DOWNLOAD_CHUNKS', False) or not document.merkle_leaves:
+        return []
+    if file_path != (document.signed_path or document.original_path):
+        return []
+    
+    chunk_size = document.merkle_chunk_size
+    indexes = None
+    # With If-Range the whole file may be sent instead, so everything is checked
+    if request.range and request.range.units == 'bytes' and 'If-Range' not in request.headers:
+        byte_range = request.range.range_for_length(get_storage().size(file_path))
+        if byte_range:
+            indexes = chunks_for_range(byte_range[0], byte_range[1], chunk_size)
+    
+    return find_corrupt_chunks(file_path, document.merkle_leaves, chunk_size, indexes)
+
+def send_document_file(document, file_path, **kwargs):
+    """Serve a document file with ETag, Last-Modified, 304 and Range support"""
+    etag = document_etag(document, file_path)
+    last_modified = document.updated_at
+    
+    if not_modified(etag, last_modified):
+        response = make_response('', 304)
+        if etag:
+            response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    else:
+        corrupt_chunks = corrupt_served_chunks(document, file_path)
+        if corrupt_chunks:
+            current_app.logger.error(f"Document {document.id} failed verification in chunks {corrupt_chunks}")
+            return jsonify({'error': 'Stored file failed integrity verification'}), 500
+        
+        response = get_storage().send(file_path, etag=etag, last_modified=last_modified, **kwargs)
+    
+    # Clients must revalidate, and shared caches must not store private documents
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def draft_etag(document, file_path):
+    """ETag of the watermarked draft view of a document file"""
+    etag = document_etag(document, file_path)
+    return f"{etag}-draft" if etag else None
+
+def send_draft_view(document, file_path):
+    """Stream a watermarked draft of a document, rendered on the fly without a stored copy"""
+    etag = draft_etag(document, file_path)
+    
+    if not_modified(etag, document.updated_at):
+        response = make_response('', 304)
+    else:
+        # The local copy (a download for remote storage) lives until the stream ends
+        local_copy = ExitStack()
+        pdf_path = local_copy.enter_context(get_storage().local_copy(file_path))
+        draft = draft_pdf_stream(pdf_path, current_app.config.get('DRAFT_WATERMARK_TEXT', 'DRAFT'))
+        if draft is None:
+            local_copy.close()
+            return jsonify({'error': 'Could not render draft view'}), 500
+        
+        content_length, chunks = draft
+        
+        def generate():
+            with local_copy:
+                yield from chunks
+        
+        response = Response(stream_with_context(generate()), mimetype='application/pdf')
+        response.content_length = content_length
+    
+    if etag:
+        response.set_etag(etag)
+    if document.updated_at:
+        response.last_modified = document.updated_at.replace(tzinfo=timezone.utc)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def is_initial_request(revalidated):
+    """Only the first request of a view is logged, not 304s or follow-up byte ranges"""
+    if revalidated:
         return False
+    return not request.range or all(start == 0 for start, _ in request.range.ranges)
+
+def create_document(user_id, filename, file_path, ingested, commit=True):
+    """Turn an ingested upload into a stored Document
+    
+    Returns (document, error, status_code). A rejected file is removed.
+    """
+    upload_folder = os.path.dirname(file_path)
+    name, ext = os.path.splitext(filename)
+    
+    # Verify file type
+    if not ingested['mime_type']:
+        os.remove(file_path)
+        return None, 'Could not determine file type', 400
+    
+    if ingested['mime_type'] not in EXTENSION_MIME_TYPES[ext[1:].lower()]:
+        os.remove(file_path)
+        return None, 'File content does not match its extension', 400
+    
+    # Convert DOCX to PDF if necessary
+    final_path = file_path
+    file_hash = ingested['sha256_hash']
+    # Chunk digests allow verifying parts of the file in parallel later
+    merkle_tree = ingested['merkle_tree']
+    if ext.lower() in ['.docx', '.doc']:
+        pdf_filename = f"{name}_{uuid.uuid4().hex}.pdf"
+        pdf_path = os.path.join(upload_folder, pdf_filename)
+        
+        if convert_docx_to_pdf(file_path, pdf_path, source_hash=file_hash):
+            final_path = pdf_path
+            # The converted PDF is a new file, read once for both hashes
+            file_hash, merkle_tree = sha256_file_with_tree(final_path)
+            # Keep original file for reference
+        else:
+            os.remove(file_path)
+            return None, 'Failed to convert document to PDF', 500
+    
+    # Create document record
+    document = Document(
+        user_id=user_id,
+        filename=filename,
+        original_path=final_path,
+        sha256_hash=file_hash
+    )
+    document.set_merkle_tree(merkle_tree)
+    
+    # Record page geometry once so editor and signing calls do not re-parse the PDF
+    is_pdf = final_path.lower().endswith('.pdf')
+    if is_pdf:
+        document.set_geometry(extract_pdf_geometry(final_path))
+        # file_hash is also the blob key of the original, i.e. its preview_key
+        render_page_preview(final_path, file_hash, 1, 'thumbnail')
+    
+    db.session.add(document)
+    db.session.flush()
+    
+    # Build the full-text index while the upload is still a local file
+    if is_pdf:
+        index_document(document.id, user_id, final_path, commit=False)
+    
+    # Identical uploads share one stored file
+    document.original_path = store_blob(final_path, file_hash, os.path.splitext(final_path)[1])
+    
+    if commit:
+        db.session.commit()
+    return document, None, None
 
 @documents_bp.route('/documents', methods=['GET'])
 @jwt_required()
@@ -87,7 +257,15 @@ def get_documents():
             query = query.filter_by(status=status)
         
         if search:
-            query = query.filter(Document.filename.contains(search))
+            # Match on filename or on indexed document content
+            content_matches = matching_document_ids(search, current_user_id)
+            if content_matches is not None:
+                query = query.filter(or_(
+                    Document.filename.contains(search),
+                    Document.id.in_(content_matches)
+                ))
+            else:
+                query = query.filter(Document.filename.contains(search))
         
         # Order by creation date (newest first)
         query = query.order_by(Document.created_at.desc())
@@ -111,6 +289,45 @@ def get_documents():
         current_app.logger.error(f"Get documents error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@documents_bp.route('/documents/search', methods=['GET'])
+@jwt_required()
+def search_document_contents():
+    """Full-text search over the user's document contents, ranked by relevance"""
+    try:
+        current_user_id = get_jwt_identity()
+        user = User.query.get(current_user_id)
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        search = request.args.get('q', '').strip()
+        page = request.args.get('page', 1, type=int)
+        per_page = min(request.args.get('per_page', 10, type=int), 100)
+        
+        if not search:
+            return jsonify({'error': 'Search query is required'}), 400
+        
+        results = search_documents(search, current_user_id, limit=per_page, offset=(page - 1) * per_page)
+        
+        documents = {
+            doc.id: doc for doc in Document.query.filter(
+                Document.id.in_([result['document_id'] for result in results])
+            ).all()
+        }
+        
+        return jsonify({
+            'results': [
+                dict(result, document=documents[result['document_id']].to_dict())
+                for result in results if result['document_id'] in documents
+            ],
+            'current_page': page,
+            'per_page': per_page
+        }), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Search documents error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @documents_bp.route('/documents', methods=['POST'])
 @jwt_required()
 def upload_document():
@@ -145,48 +362,221 @@ def upload_document():
         unique_filename = f"{name}_{uuid.uuid4().hex}{ext}"
         file_path = os.path.join(upload_folder, unique_filename)
         
-        # Save file
-        file.save(file_path)
+        # Save file, hashing and sniffing it in the same pass
+        ingested = ingest_upload(file.stream, file_path)
         
-        # Verify file type
-        file_type = get_file_type(file_path)
-        if not file_type:
-            os.remove(file_path)
-            return jsonify({'error': 'Could not determine file type'}), 400
+        document, error, status_code = create_document(current_user_id, filename, file_path, ingested)
+        if error:
+            return jsonify({'error': error}), status_code
         
-        # Convert DOCX to PDF if necessary
-        final_path = file_path
-        if ext.lower() in ['.docx', '.doc']:
-            pdf_filename = f"{name}_{uuid.uuid4().hex}.pdf"
-            pdf_path = os.path.join(upload_folder, pdf_filename)
-            
-            if convert_docx_to_pdf(file_path, pdf_path):
-                final_path = pdf_path
-                # Keep original file for reference
-            else:
-                os.remove(file_path)
-                return jsonify({'error': 'Failed to convert document to PDF'}), 500
+        # Log document upload
+        log_action(
+            'document_uploaded', 
+            user_id=current_user_id, 
+            document_id=document.id,
+            details=f'Uploaded: {filename}',
+            ip_address=request.remote_addr
+        )
         
-        # Calculate file hash
-        file_hash = calculate_file_hash(final_path)
+        return jsonify({
+            'message': 'Document uploaded successfully',
+            'document': document.to_dict()
+        }), 201
         
-        # Create document record
-        document = Document(
-            user_id=current_user_id,
-            filename=filename,
-            original_path=final_path,
-            sha256_hash=file_hash
-        )
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Upload document error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def get_upload_session(upload_id, user_id, lock=False):
+    """Return a user's upload session unless it does not exist or has expired"""
+    query = UploadSession.query.filter_by(id=upload_id, user_id=user_id)
+    if lock:
+        # Chunks of one upload are written one at a time
+        query = query.with_for_update()
+    upload = query.first()
+    if upload is None or upload.expires_at < datetime.utcnow():
+        return None
+    return upload
+
+def upload_session_status(upload):
+    return dict(
+        upload.to_dict(),
+        offset=upload.received_size,
+        chunk_size=current_app.config.get('UPLOAD_CHUNK_SIZE', 8388608)
+    )
+
+@documents_bp.route('/uploads', methods=['POST'])
+@jwt_required()
+def create_upload():
+    """Start a resumable upload for files larger than a single request allows"""
+    try:
+        current_user_id = get_jwt_identity()
+        user = User.query.get(current_user_id)
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        data = request.get_json() or {}
+        filename = secure_filename(data.get('filename') or '')
+        size = data.get('size')
+        
+        if not filename:
+            return jsonify({'error': 'No file selected'}), 400
+        
+        if not allowed_file(filename):
+            return jsonify({'error': 'File type not allowed. Only PDF, DOC, and DOCX files are supported'}), 400
+        
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            return jsonify({'error': 'File size is required'}), 400
         
-        db.session.add(document)
+        if size > current_app.config.get('MAX_UPLOAD_SIZE', 536870912):
+            return jsonify({'error': 'File is too large'}), 413
+        
+        upload = create_upload_session(current_user_id, filename, size)
         db.session.commit()
         
-        # Log document upload
+        return jsonify({
+            'message': 'Upload session created',
+            'upload': upload_session_status(upload)
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Create upload error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@documents_bp.route('/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload(upload_id):
+    """Get the offset an interrupted upload resumes from"""
+    try:
+        current_user_id = get_jwt_identity()
+        upload = get_upload_session(upload_id, current_user_id)
+        
+        if not upload:
+            return jsonify({'error': 'Upload not found'}), 404
+        
+        return jsonify({'upload': upload_session_status(upload)}), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Get upload error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@documents_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@jwt_required()
+def upload_chunk(upload_id):
+    """Append a chunk, given by Content-Range (bytes start-end/total) or ?offset="""
+    try:
+        current_user_id = get_jwt_identity()
+        
+        content_range = parse_content_range_header(request.headers.get('Content-Range'))
+        if content_range:
+            offset = content_range.start
+            length = content_range.stop - content_range.start
+            if request.content_length is not None and request.content_length != length:
+                return jsonify({'error': 'Content-Range does not match Content-Length'}), 400
+        else:
+            offset = request.args.get('offset', type=int)
+            length = request.content_length
+        
+        if offset is None:
+            return jsonify({'error': 'Chunk offset is required'}), 400
+        
+        if length is None:
+            return jsonify({'error': 'Content-Length is required'}), 411
+        
+        if length > current_app.config.get('UPLOAD_CHUNK_SIZE', 8388608):
+            return jsonify({'error': 'Chunk is too large'}), 413
+        
+        upload = get_upload_session(upload_id, current_user_id, lock=True)
+        
+        if not upload:
+            return jsonify({'error': 'Upload not found'}), 404
+        
+        if upload.document_id:
+            return jsonify({'error': 'Upload is already complete'}), 409
+        
+        if content_range and content_range.length is not None and content_range.length != upload.total_size:
+            return jsonify({'error': 'Content-Range total does not match the upload size'}), 400
+        
+        # A retried chunk that was already stored is acknowledged without rewriting it
+        if length and offset + length <= upload.received_size:
+            status = upload_session_status(upload)
+            db.session.rollback()
+            return jsonify({'upload': status}), 200
+        
+        try:
+            append_chunk(upload, offset, length, request.stream)
+        except ChunkError as e:
+            received_size = upload.received_size
+            db.session.rollback()
+            return jsonify({'error': str(e), 'offset': received_size}), 409
+        
+        db.session.commit()
+        
+        return jsonify({'upload': upload_session_status(upload)}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Upload chunk error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@documents_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_upload(upload_id):
+    """Turn a fully received upload into a document"""
+    try:
+        current_user_id = get_jwt_identity()
+        upload = get_upload_session(upload_id, current_user_id, lock=True)
+        
+        if not upload:
+            return jsonify({'error': 'Upload not found'}), 404
+        
+        # Completing twice (e.g. after a lost response) returns the same document
+        if upload.document_id:
+            document = Document.query.get(upload.document_id)
+            db.session.rollback()
+            if document:
+                return jsonify({
+                    'message': 'Document uploaded successfully',
+                    'document': document.to_dict()
+                }), 200
+            return jsonify({'error': 'Upload not found'}), 404
+        
+        if upload.received_size != upload.total_size:
+            received_size = upload.received_size
+            db.session.rollback()
+            return jsonify({'error': 'Upload is incomplete', 'offset': received_size}), 409
+        
+        name, ext = os.path.splitext(upload.filename)
+        file_path = os.path.join(current_app.config.get('UPLOAD_FOLDER', 'uploads'), f"{name}_{uuid.uuid4().hex}{ext}")
+        ingested = finish_upload(upload, file_path)
+        
+        try:
+            document, error, status_code = create_document(current_user_id, upload.filename, file_path, ingested, commit=False)
+        except Exception:
+            # The staged chunks are still there, so completing can be retried
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+        
+        if error:
+            discard_upload(upload.id)
+            db.session.delete(upload)
+            db.session.commit()
+            return jsonify({'error': error}), status_code
+        
+        upload.document_id = document.id
+        upload.expires_at = session_expiry()
+        db.session.commit()
+        discard_upload(upload.id)
+        
         log_action(
             'document_uploaded', 
             user_id=current_user_id, 
             document_id=document.id,
-            details=f'Uploaded: {filename}',
+            details=f'Uploaded: {upload.filename}',
             ip_address=request.remote_addr
         )
         
@@ -197,7 +587,30 @@ def upload_document():
         
     except Exception as e:
         db.session.rollback()
-        current_app.logger.error(f"Upload document error: {str(e)}")
+        current_app.logger.error(f"Complete upload error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@documents_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def abort_upload(upload_id):
+    """Abandon an upload and discard the chunks received so far"""
+    try:
+        current_user_id = get_jwt_identity()
+        upload = get_upload_session(upload_id, current_user_id, lock=True)
+        
+        if not upload:
+            return jsonify({'error': 'Upload not found'}), 404
+        
+        if not upload.document_id:
+            discard_upload(upload.id)
+        db.session.delete(upload)
+        db.session.commit()
+        
+        return jsonify({'message': 'Upload aborted'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Abort upload error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
 @documents_bp.route('/documents/<int:document_id>', methods=['GET'])
@@ -227,8 +640,11 @@ def get_document(document_id):
             ip_address=request.remote_addr
         )
         
+        page_geometry = load_document_geometry(document)
+        
         return jsonify({
             'document': document.to_dict(),
+            'page_geometry': page_geometry,
             'fields': [field.to_dict() for field in fields]
         }), 200
         
@@ -236,60 +652,120 @@ def get_document(document_id):
         current_app.logger.error(f"Get document error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+def validate_field_placements(document, fields):
+    """Check placements against the stored page geometry; returns an error message or None"""
+    if not load_document_geometry(document):
+        return None
+    
+    for field_data in fields:
+        page_size = document.page_size(field_data['page_number'])
+        if not page_size:
+            return f'Invalid page number: {field_data["page_number"]}'
+        
+        width, height = page_size
+        if not (0 <= field_data['x_coord'] <= width and 0 <= field_data['y_coord'] <= height):
+            return f'Field position outside of page {field_data["page_number"]}'
+    
+    return None
+
+def save_document_fields(document_id, upserts, deletes=(), version=None, replace=False):
+    """Validate and apply a field layout change for the current user's document"""
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+    
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    document = Document.query.filter_by(id=document_id, user_id=current_user_id).first()
+    
+    if not document:
+        return jsonify({'error': 'Document not found'}), 404
+    
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+        return jsonify({'error': 'Invalid layout version'}), 400
+    
+    if not isinstance(upserts, list) or not isinstance(deletes, (list, tuple)):
+        return jsonify({'error': 'Fields must be sent as a list'}), 400
+    
+    placements = []
+    for index, field_data in enumerate(upserts):
+        if not isinstance(field_data, dict):
+            return jsonify({'error': f'Field {index} must be an object', 'index': index}), 400
+        if len(str(field_data.get('client_id') or '')) > MAX_CLIENT_ID_LENGTH:
+            return jsonify({
+                'error': f'Field {index} client_id is longer than {MAX_CLIENT_ID_LENGTH} characters',
+                'index': index
+            }), 400
+        try:
+            placements.append(normalize_field(field_data))
+        except ValueError as e:
+            return jsonify({'error': f'Field {index}: {e}', 'index': index}), 400
+    
+    # Validate placements against the stored page geometry
+    error = validate_field_placements(document, placements)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    try:
+        changes = save_field_layout(document, upserts, deletes, version=version, replace=replace)
+    except LayoutConflict as e:
+        db.session.rollback()
+        return jsonify({
+            'error': 'Fields were changed by another save, reload the layout',
+            'version': e.current_version
+        }), 409
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    db.session.commit()
+    
+    # Log field update
+    log_action(
+        'document_fields_updated', 
+        user_id=current_user_id, 
+        document_id=document_id,
+        details=f'Fields saved: {changes["inserted"]} added, {changes["updated"]} updated, {changes["deleted"]} removed',
+        ip_address=request.remote_addr
+    )
+    
+    return jsonify(dict(changes, message='Document fields updated successfully')), 200
+
 @documents_bp.route('/documents/<int:document_id>/fields', methods=['POST'])
 @jwt_required()
 def add_document_fields(document_id):
-    """Add fields to document (for drag-and-drop editor)"""
+    """Save the whole field layout of a document (for drag-and-drop editor)
+    
+    Fields are matched to stored ones by ``client_id``, so only added,
+    moved and removed fields are written. Send the ``version`` the layout
+    was loaded at to reject saves that would overwrite a newer one.
+    """
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        document = Document.query.filter_by(id=document_id, user_id=current_user_id).first()
-        
-        if not document:
-            return jsonify({'error': 'Document not found'}), 404
-        
         data = request.get_json()
         if not data or 'fields' not in data:
             return jsonify({'error': 'Fields data is required'}), 400
         
-        # Clear existing fields
-        DocumentField.query.filter_by(document_id=document_id).delete()
-        
-        # Add new fields
-        for field_data in data['fields']:
-            field = DocumentField(
-                document_id=document_id,
-                field_type=field_data['field_type'],
-                page_number=field_data['page_number'],
-                x_coord=field_data['x_coord'],
-                y_coord=field_data['y_coord'],
-                width=field_data.get('width'),
-                height=field_data.get('height')
-            )
-            db.session.add(field)
-        
-        db.session.commit()
+        return save_document_fields(document_id, data['fields'], version=data.get('version'), replace=True)
         
-        # Log field update
-        log_action(
-            'document_fields_updated', 
-            user_id=current_user_id, 
-            document_id=document_id,
-            details=f'Added {len(data["fields"])} fields',
-            ip_address=request.remote_addr
-        )
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Add document fields error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@documents_bp.route('/documents/<int:document_id>/fields', methods=['PATCH'])
+@jwt_required()
+def update_document_fields(document_id):
+    """Apply only the changed fields: ``upsert`` field data and ``delete`` client ids"""
+    try:
+        data = request.get_json()
+        if not data or ('upsert' not in data and 'delete' not in data):
+            return jsonify({'error': 'Fields data is required'}), 400
         
-        return jsonify({
-            'message': 'Document fields updated successfully'
-        }), 200
+        return save_document_fields(document_id, data.get('upsert') or [], data.get('delete') or [], version=data.get('version'))
         
     except Exception as e:
         db.session.rollback()
-        current_app.logger.error(f"Add document fields error: {str(e)}")
+        current_app.logger.error(f"Update document fields error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
 @documents_bp.route('/documents/<int:document_id>/download', methods=['GET'])
@@ -311,18 +787,21 @@ def download_document(document_id):
         # Determine which file to serve (signed version if available)
         file_path = document.signed_path if document.signed_path else document.original_path
         
-        if not os.path.exists(file_path):
+        revalidated = not_modified(document_etag(document, file_path), document.updated_at)
+        if not revalidated and not get_storage().exists(file_path):
             return jsonify({'error': 'File not found on disk'}), 404
         
         # Log document download
-        log_action(
-            'document_downloaded', 
-            user_id=current_user_id, 
-            document_id=document_id,
-            ip_address=request.remote_addr
-        )
+        if is_initial_request(revalidated):
+            log_action(
+                'document_downloaded', 
+                user_id=current_user_id, 
+                document_id=document_id,
+                ip_address=request.remote_addr
+            )
         
-        return send_file(
+        return send_document_file(
+            document,
             file_path,
             as_attachment=True,
             download_name=document.filename
@@ -352,12 +831,14 @@ def delete_document(document_id):
         if document.status == 'signed':
             return jsonify({'error': 'Cannot delete signed documents'}), 400
         
-        # Delete files from disk
+        # Release stored files; shared blobs are only removed once unreferenced
         try:
-            if document.original_path and os.path.exists(document.original_path):
-                os.remove(document.original_path)
-            if document.signed_path and os.path.exists(document.signed_path):
-                os.remove(document.signed_path)
+            release_blob(document.original_path)
+            release_blob(document.signed_path)
+            
+            # Previews are keyed by the original's content and shared with identical uploads
+            if not Document.query.filter(Document.original_path == document.original_path, Document.id != document_id).first():
+                remove_previews(preview_key(document))
         except Exception as e:
             current_app.logger.warning(f"Could not delete files for document {document_id}: {str(e)}")
         
@@ -371,6 +852,7 @@ def delete_document(document_id):
         )
         
         # Delete document record (cascade will handle related records)
+        remove_document_index(document_id)
         db.session.delete(document)
         db.session.commit()
         
@@ -386,7 +868,7 @@ def delete_document(document_id):
 @documents_bp.route('/documents/<int:document_id>/preview', methods=['GET'])
 @jwt_required()
 def preview_document(document_id):
-    """Get document for preview (serve file directly)"""
+    """Get document for preview (serve file directly, or a watermarked draft with ?draft=true)"""
     try:
         current_user_id = get_jwt_identity()
         user = User.query.get(current_user_id)
@@ -401,20 +883,79 @@ def preview_document(document_id):
         
         file_path = document.original_path
         
-        if not os.path.exists(file_path):
+        draft = request.args.get('draft', '').lower() == 'true'
+        if draft and not file_path.lower().endswith('.pdf'):
+            return jsonify({'error': 'Draft view is only available for PDF documents'}), 400
+        
+        etag = draft_etag(document, file_path) if draft else document_etag(document, file_path)
+        revalidated = not_modified(etag, document.updated_at)
+        if not revalidated and not get_storage().exists(file_path):
             return jsonify({'error': 'File not found on disk'}), 404
         
         # Log document preview
-        log_action(
-            'document_previewed', 
-            user_id=current_user_id, 
-            document_id=document_id,
-            ip_address=request.remote_addr
-        )
+        if is_initial_request(revalidated):
+            log_action(
+                'document_previewed', 
+                user_id=current_user_id, 
+                document_id=document_id,
+                ip_address=request.remote_addr
+            )
         
-        return send_file(file_path)
+        if draft:
+            return send_draft_view(document, file_path)
+        
+        return send_document_file(document, file_path)
         
     except Exception as e:
         current_app.logger.error(f"Preview document error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@documents_bp.route('/documents/<int:document_id>/pages/<int:page_number>/preview', methods=['GET'])
+@jwt_required()
+def preview_document_page(document_id, page_number):
+    """Serve a cached thumbnail or low-resolution image of a single page"""
+    try:
+        current_user_id = get_jwt_identity()
+        user = User.query.get(current_user_id)
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        document = Document.query.filter_by(id=document_id, user_id=current_user_id).first()
+        
+        if not document:
+            return jsonify({'error': 'Document not found'}), 404
+        
+        size = request.args.get('size', 'thumbnail')
+        if size not in PREVIEW_SIZES:
+            return jsonify({'error': f'Invalid size. Use one of: {", ".join(PREVIEW_SIZES)}'}), 400
+        
+        if not previews_available():
+            return jsonify({'error': 'Page previews are not available'}), 501
+        
+        if document.page_count and not 1 <= page_number <= document.page_count:
+            return jsonify({'error': 'Page not found'}), 404
+        
+        # Cached previews are served without touching document storage
+        document_hash = preview_key(document)
+        image_path = preview_path(document_hash, page_number, size) if document_hash else None
+        if not image_path or not os.path.exists(image_path):
+            storage = get_storage()
+            if not storage.exists(document.original_path):
+                return jsonify({'error': 'File not found on disk'}), 404
+            
+            with storage.local_copy(document.original_path) as pdf_path:
+                image_path = render_page_preview(pdf_path, document_hash, page_number, size)
+        
+        if not image_path:
+            return jsonify({'error': 'Could not render page preview'}), 404
+        
+        # Previews are immutable for a given content hash but belong to one user
+        response = send_file(image_path, mimetype='image/png', max_age=86400)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        return response
+        
+    except Exception as e:
+        current_app.logger.error(f"Preview document page error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
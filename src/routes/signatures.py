@@ -1,15 +1,20 @@
 from flask import Blueprint, request, jsonify, current_app, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from src.models.user import User, Document, SignatureRequest, AuditLog, db
-from src.utils.pdf_utils_simple import add_signature_to_pdf, generate_qr_code
-from src.utils.security import calculate_sha256, generate_timestamp
+from src.models.user import User, Document, DocumentField, SignatureRequest, SignatureEnvelope, AuditLog, db
+from src.utils.pdf_utils import add_signature_to_pdf, generate_qr_code, linearize_pdf
+from src.utils.hashing import sha256_file_with_tree
+from src.utils.security import calculate_stored_sha256, generate_timestamp
+from src.utils.verification_cache import cache_verification, get_cached_verification
+from src.utils.storage import get_storage
+from src.utils.blob_store import release_blob, store_blob
+from src.tasks import sign_document_task
 import os
 from datetime import datetime
 import uuid
 
 signatures_bp = Blueprint('signatures', __name__)
 
-def log_action(action_type, user_id=None, document_id=None, details=None, ip_address=None):
+def log_action(action_type, user_id=None, document_id=None, details=None, ip_address=None, commit=True):
     """Log user actions for audit trail"""
     log = AuditLog(
         action_type=action_type,
@@ -19,7 +24,35 @@ def log_action(action_type, user_id=None, document_id=None, details=None, ip_add
         ip_address=ip_address
     )
     db.session.add(log)
-    db.session.commit()
+    if commit:
+        db.session.commit()
+
+def remove_files(paths):
+    """Remove stamped files that belong to a rolled back signing"""
+    for path in paths:
+        try:
+            if path and os.path.exists(path):
+                os.remove(path)
+        except Exception as e:
+            current_app.logger.warning(f"Could not remove file {path}: {str(e)}")
+
+def store_signed_file(document, signed_pdf_path):
+    """Move a stamped PDF into the blob store and point the document at it"""
+    # The hash and the Merkle tree come from one read of the file
+    try:
+        signed_hash, merkle_tree = sha256_file_with_tree(signed_pdf_path)
+    except OSError as e:
+        raise ValueError(f"Could not hash signed file for document {document.id}: {str(e)}")
+    
+    # Re-signing replaces the previous signed file
+    if document.signed_path:
+        release_blob(document.signed_path)
+    
+    # The Merkle tree follows sha256_hash to the signed file
+    document.set_merkle_tree(merkle_tree)
+    document.signed_path = store_blob(signed_pdf_path, signed_hash, os.path.splitext(signed_pdf_path)[1])
+    document.sha256_hash = signed_hash
+    document.bump_verification_version()
 
 @signatures_bp.route('/documents/<int:document_id>/signature-requests', methods=['POST'])
 @jwt_required()
@@ -87,7 +120,11 @@ def create_signature_request(document_id):
 
 @signatures_bp.route('/signature-requests/<int:request_id>/sign', methods=['POST'])
 def sign_document(request_id):
-    """Sign a document (electronic signature)"""
+    """Sign a document (electronic signature)
+
+    With ``ASYNC_SIGNING`` enabled the PDF stamping runs on a Celery worker
+    and the response is a 202 with a job id to poll.
+    """
     try:
         signature_request = SignatureRequest.query.get(request_id)
         
@@ -116,101 +153,468 @@ def sign_document(request_id):
         if signer and not signer.can_sign_document():
             return jsonify({'error': 'Free document limit exceeded. Please upgrade to continue signing.'}), 403
         
-        # Process electronic signature
-        if signature_request.signature_type == 'electronic':
-            # Generate signed PDF with signature footer and QR code
-            signed_pdf_path = process_electronic_signature(document, signature_request, ip_address, geolocation)
-            
-            if not signed_pdf_path:
-                return jsonify({'error': 'Failed to process signature'}), 500
-            
-            # Update signature request
-            signature_request.status = 'signed'
-            signature_request.signed_at = datetime.utcnow()
-            signature_request.ip_address = ip_address
-            signature_request.geolocation = geolocation
-            signature_request.biometric_data_placeholder = biometric_data
-            
-            # Update document
-            document.status = 'signed'
-            document.signed_path = signed_pdf_path
-            document.sha256_hash = calculate_sha256(signed_pdf_path)
-            
-            # Increment signed documents count for signer
-            if signer:
-                signer.increment_signed_documents()
-            
-            db.session.commit()
-            
-            # Log signature completion
-            log_action(
-                'document_signed_electronic',
-                user_id=signer.id if signer else None,
-                document_id=document.id,
-                details=f'Electronic signature by {signature_request.signer_email}',
-                ip_address=ip_address
-            )
-            
-            return jsonify({
-                'message': 'Document signed successfully',
-                'signature_request': signature_request.to_dict(),
-                'verification_url': url_for('signatures.verify_document', document_id=document.id, _external=True)
-            }), 200
-            
-        elif signature_request.signature_type == 'digital':
+        if signature_request.signature_type == 'digital':
             # Placeholder for ICP-Brasil digital signature
             return jsonify({'error': 'Digital signature not implemented yet'}), 501
         
+        verification_url = url_for('signatures.verify_document', document_id=document.id, _external=True)
+        
+        if current_app.config.get('ASYNC_SIGNING', False):
+            return enqueue_signing_job(signature_request, ip_address, geolocation, biometric_data, verification_url)
+        
+        # Process electronic signature inline
+        error, status_code = complete_electronic_signature(
+            request_id, ip_address, geolocation, biometric_data, verification_url
+        )
+        
+        if error:
+            return jsonify({'error': error}), status_code
+        
+        return jsonify({
+            'message': 'Document signed successfully',
+            'signature_request': SignatureRequest.query.get(request_id).to_dict(),
+            'verification_url': verification_url
+        }), 200
+        
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Sign document error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-def process_electronic_signature(document, signature_request, ip_address, geolocation):
+def enqueue_signing_job(signature_request, ip_address, geolocation, biometric_data, verification_url):
+    """Queue the stamping of a signature request and answer with the job id"""
+    # The row lock makes concurrent sign calls agree on a single job
+    signature_request = SignatureRequest.query.filter_by(id=signature_request.id).with_for_update().populate_existing().first()
+    if signature_request.status != 'pending':
+        db.session.rollback()
+        return jsonify({'error': 'Signature request is not pending'}), 400
+    
+    job_id = signature_request.signing_job_id
+    
+    # A request already being processed keeps its job instead of queueing a second one
+    if not job_id or signing_job_error(signature_request):
+        timeout = current_app.config.get('SIGNING_JOB_TIMEOUT', 600)
+        job_id = str(uuid.uuid4())
+        signature_request.signing_job_id = job_id
+        signature_request.signing_job_queued_at = datetime.utcnow()
+        db.session.commit()
+        
+        try:
+            # A job that is not picked up or does not finish in time is dropped, so a replacement cannot race it
+            sign_document_task.apply_async(
+                args=[signature_request.id, ip_address, geolocation, biometric_data, verification_url],
+                task_id=job_id,
+                expires=timeout,
+                time_limit=timeout
+            )
+        except Exception as e:
+            current_app.logger.error(f"Enqueue signing job error: {str(e)}")
+            signature_request = SignatureRequest.query.get(signature_request.id)
+            signature_request.signing_job_id = None
+            signature_request.signing_job_queued_at = None
+            db.session.commit()
+            return jsonify({'error': 'Signing service unavailable. Please try again later.'}), 503
+    else:
+        db.session.rollback()
+    
+    return jsonify({
+        'message': 'Signature is being processed',
+        'job_id': job_id,
+        'status_url': url_for('signatures.get_signing_job', job_id=job_id, _external=True)
+    }), 202
+
+def signing_job_error(signature_request):
+    """Return why the signing job of a request failed, or None while it is queued, running or done
+
+    Jobs expire from the queue and are killed after SIGNING_JOB_TIMEOUT
+    seconds, so one still unfinished after that (a lost message, an expired
+    result) is treated as failed rather than waited on forever.
+    """
+    result = sign_document_task.AsyncResult(signature_request.signing_job_id)
+    
+    if result.successful():
+        if isinstance(result.result, dict) and 'error' in result.result:
+            return result.result['error']
+        return None
+    if result.ready():
+        # Raised, revoked or expired
+        return 'Failed to process signature'
+    
+    timeout = current_app.config.get('SIGNING_JOB_TIMEOUT', 600)
+    queued_at = signature_request.signing_job_queued_at
+    age = (datetime.utcnow() - queued_at).total_seconds() if queued_at else float('inf')
+    # Queued jobs expire after the timeout; started ones run for at most another timeout
+    if age > (timeout if result.state == 'PENDING' else 2 * timeout):
+        return 'Signing job timed out'
+    return None
+
+def complete_electronic_signature(request_id, ip_address, geolocation, biometric_data, verification_url):
+    """Stamp the signed PDF and record the signature.
+
+    Shared by the inline route and the Celery task. Returns an
+    ``(error, status_code)`` tuple, with ``error`` set to None on success.
+    """
+    signature_request = SignatureRequest.query.get(request_id)
+    
+    if not signature_request:
+        return 'Signature request not found', 404
+    
+    if signature_request.status != 'pending':
+        return 'Signature request is not pending', 400
+    
+    document = signature_request.document
+    
+    # Check if user can sign (freemium logic)
+    signer = User.query.filter_by(email=signature_request.signer_email).first()
+    if signer and not signer.can_sign_document():
+        return 'Free document limit exceeded. Please upgrade to continue signing.', 403
+    
+    # Generate signed PDF with signature footer and QR code
+    signed_at = datetime.utcnow()
+    signed_pdf_path = process_electronic_signature(
+        document, signature_request, ip_address, geolocation,
+        signed_at=signed_at, verification_url=verification_url
+    )
+    
+    if not signed_pdf_path:
+        return 'Failed to process signature', 500
+    
+    # Update signature request
+    signature_request.status = 'signed'
+    signature_request.signed_at = signed_at
+    signature_request.ip_address = ip_address
+    signature_request.geolocation = geolocation
+    signature_request.biometric_data_placeholder = biometric_data
+    
+    # Update document
+    document.status = 'signed'
+    try:
+        store_signed_file(document, signed_pdf_path)
+    except Exception as e:
+        db.session.rollback()
+        remove_files([signed_pdf_path])
+        current_app.logger.error(f"Could not store signed file: {str(e)}")
+        return 'Failed to process signature', 500
+    
+    # Increment signed documents count for signer
+    if signer:
+        signer.increment_signed_documents(commit=False)
+    
+    db.session.commit()
+    
+    # Log signature completion
+    log_action(
+        'document_signed_electronic',
+        user_id=signer.id if signer else None,
+        document_id=document.id,
+        details=f'Electronic signature by {signature_request.signer_email}',
+        ip_address=ip_address
+    )
+    
+    return None, 200
+
+@signatures_bp.route('/signing-jobs/<job_id>', methods=['GET'])
+def get_signing_job(job_id):
+    """Get the status of an asynchronous signing job"""
+    try:
+        signature_request = SignatureRequest.query.filter_by(signing_job_id=job_id).first()
+        
+        if not signature_request:
+            return jsonify({'error': 'Signing job not found'}), 404
+        
+        response = {
+            'job_id': job_id,
+            'signature_request_id': signature_request.id
+        }
+        
+        if signature_request.status == 'signed':
+            response['status'] = 'completed'
+            response['signature_request'] = signature_request.to_dict()
+            response['verification_url'] = url_for('signatures.verify_document', document_id=signature_request.document_id, _external=True)
+            return jsonify(response), 200
+        
+        result = sign_document_task.AsyncResult(job_id)
+        error = signing_job_error(signature_request)
+        
+        if error:
+            response['status'] = 'failed'
+            response['error'] = error
+        elif result.state == 'PENDING':
+            response['status'] = 'queued'
+        else:
+            response['status'] = 'processing'
+        
+        return jsonify(response), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Get signing job error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def process_electronic_signature(document, signature_request, ip_address, geolocation, signed_at=None, signature_id=None, verification_url=None):
     """Process electronic signature and generate signed PDF"""
     try:
         # Generate unique filename for signed document
         name, ext = os.path.splitext(document.filename)
         signed_filename = f"{name}_signed_{uuid.uuid4().hex}{ext}"
         
+        # Stamped locally, then moved to document storage by store_signed_file
         upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
+        os.makedirs(upload_folder, exist_ok=True)
         signed_path = os.path.join(upload_folder, signed_filename)
         
         # Generate signature data
         signature_data = {
             'signer_email': signature_request.signer_email,
-            'signed_at': datetime.utcnow().isoformat(),
+            'signed_at': (signed_at or datetime.utcnow()).isoformat(),
             'ip_address': ip_address,
             'geolocation': geolocation,
-            'signature_id': str(uuid.uuid4()),
+            'signature_id': signature_id or str(uuid.uuid4()),
             'document_id': document.id
         }
         
-        # Generate QR code for verification
-        verification_url = url_for('signatures.verify_document', document_id=document.id, _external=True)
-        qr_code_path = generate_qr_code(verification_url)
-        
-        # Add signature footer and QR code to PDF
-        success = add_signature_to_pdf(
-            document.original_path,
-            signed_path,
-            signature_data,
-            qr_code_path
-        )
-        
-        # Clean up temporary QR code file
-        if qr_code_path and os.path.exists(qr_code_path):
-            os.remove(qr_code_path)
+        # Generate QR code for verification (cached per verification URL)
+        if not verification_url:
+            verification_url = url_for('signatures.verify_document', document_id=document.id, _external=True)
+        qr_code = generate_qr_code(verification_url)
+        
+        # Placed fields grouped by page, so each page gets one overlay for all its fields
+        fields = {}
+        for field in DocumentField.query.filter_by(document_id=document.id).order_by(DocumentField.page_number, DocumentField.id):
+            fields.setdefault(field.page_number, []).append(field.to_dict())
+        
+        # Add signature footer, QR code and fields to PDF
+        incremental = current_app.config.get('PDF_INCREMENTAL_SIGNING', False)
+        with get_storage().local_copy(document.original_path) as original_path:
+            success = add_signature_to_pdf(
+                original_path,
+                signed_path,
+                signature_data,
+                qr_code,
+                incremental=incremental,
+                fields=fields
+            )
         
-        if success:
-            return signed_path
-        else:
+        if not success:
             return None
+        
+        # Optional fast web view; the document keeps a non-linearized copy on failure.
+        # Linearizing rewrites the whole file, which would drop the original bytes an
+        # incremental signature keeps, so incrementally signed output is never linearized.
+        document.signed_linearized = False
+        if current_app.config.get('PDF_LINEARIZE_SIGNED', False) and not incremental:
+            document.signed_linearized = linearize_pdf(signed_path)
+        
+        return signed_path
             
     except Exception as e:
         current_app.logger.error(f"Process electronic signature error: {str(e)}")
         return None
 
+@signatures_bp.route('/signature-envelopes', methods=['POST'])
+@jwt_required()
+def create_signature_envelope():
+    """Create signature requests for several documents sent to the same signer"""
+    try:
+        current_user_id = get_jwt_identity()
+        user = User.query.get(current_user_id)
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        signer_email = data.get('signer_email', '').strip().lower()
+        signature_type = data.get('signature_type', 'electronic')
+        document_ids = data.get('document_ids', [])
+        
+        if not signer_email:
+            return jsonify({'error': 'Signer email is required'}), 400
+        
+        if signature_type not in ['electronic', 'digital']:
+            return jsonify({'error': 'Invalid signature type'}), 400
+        
+        if not isinstance(document_ids, list) or not all(
+            isinstance(document_id, int) and not isinstance(document_id, bool) for document_id in document_ids
+        ):
+            return jsonify({'error': 'document_ids must be a list of document ids'}), 400
+        
+        if not document_ids:
+            return jsonify({'error': 'At least one document is required'}), 400
+        
+        documents = Document.query.filter(
+            Document.id.in_(document_ids),
+            Document.user_id == current_user_id
+        ).all()
+        
+        if len(documents) != len(set(document_ids)):
+            return jsonify({'error': 'Document not found'}), 404
+        
+        envelope = SignatureEnvelope(
+            user_id=current_user_id,
+            signer_email=signer_email
+        )
+        db.session.add(envelope)
+        
+        for document in documents:
+            db.session.add(SignatureRequest(
+                document=document,
+                envelope=envelope,
+                signer_email=signer_email,
+                signature_type=signature_type
+            ))
+            document.status = 'pending'
+            
+            log_action(
+                'signature_request_created',
+                user_id=current_user_id,
+                document_id=document.id,
+                details=f'Signature request sent to {signer_email} ({signature_type}) in envelope',
+                ip_address=request.remote_addr,
+                commit=False
+            )
+        
+        db.session.commit()
+        
+        # TODO: Send email/WhatsApp notification to signer
+        
+        return jsonify({
+            'message': 'Signature envelope created successfully',
+            'envelope': envelope.to_dict()
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Create signature envelope error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@signatures_bp.route('/signature-envelopes/<int:envelope_id>', methods=['GET'])
+def get_signature_envelope(envelope_id):
+    """Get signature envelope details (for signing page)"""
+    try:
+        envelope = SignatureEnvelope.query.get(envelope_id)
+        
+        if not envelope:
+            return jsonify({'error': 'Signature envelope not found'}), 404
+        
+        return jsonify({
+            'envelope': envelope.to_dict(),
+            'documents': [
+                {
+                    'id': req.document.id,
+                    'filename': req.document.filename,
+                    'status': req.document.status
+                }
+                for req in envelope.signature_requests
+            ]
+        }), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Get signature envelope error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@signatures_bp.route('/signature-envelopes/<int:envelope_id>/sign', methods=['POST'])
+def sign_envelope(envelope_id):
+    """Sign every pending document of an envelope in a single pass"""
+    # Stamped files not yet moved into the blob store; stored ones are released by the rollback
+    unstored_paths = []
+    try:
+        # Locked so concurrent submissions cannot both find the envelope pending
+        envelope = SignatureEnvelope.query.filter_by(id=envelope_id).with_for_update().populate_existing().first()
+        
+        if not envelope:
+            return jsonify({'error': 'Signature envelope not found'}), 404
+        
+        if envelope.status != 'pending':
+            return jsonify({'error': 'Signature envelope is not pending'}), 400
+        
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        pending_requests = [req for req in envelope.signature_requests if req.status == 'pending']
+        if not pending_requests:
+            return jsonify({'error': 'Signature envelope has no pending requests'}), 400
+        
+        if any(req.signature_type != 'electronic' for req in pending_requests):
+            # Placeholder for ICP-Brasil digital signature
+            return jsonify({'error': 'Digital signature not implemented yet'}), 501
+        
+        # Get signature data
+        ip_address = request.remote_addr
+        geolocation = data.get('geolocation', '')
+        biometric_data = data.get('biometric_data', '')  # Placeholder for future biometric integration
+        
+        # Check quota once for the whole envelope (freemium logic)
+        signer = User.query.filter_by(email=envelope.signer_email).first()
+        if signer and not signer.can_sign_document(len(pending_requests)):
+            return jsonify({'error': 'Free document limit exceeded. Please upgrade to continue signing.'}), 403
+        
+        # All documents share the signing timestamp and signature id
+        signed_at = datetime.utcnow()
+        signature_id = str(uuid.uuid4())
+        
+        verification_urls = {}
+        for signature_request in pending_requests:
+            document = signature_request.document
+            
+            signed_pdf_path = process_electronic_signature(
+                document, signature_request, ip_address, geolocation,
+                signed_at=signed_at, signature_id=signature_id
+            )
+            
+            if not signed_pdf_path:
+                db.session.rollback()
+                remove_files(unstored_paths)
+                return jsonify({'error': f'Failed to process signature for document {document.id}'}), 500
+            unstored_paths.append(signed_pdf_path)
+            
+            # Update signature request
+            signature_request.status = 'signed'
+            signature_request.signed_at = signed_at
+            signature_request.ip_address = ip_address
+            signature_request.geolocation = geolocation
+            signature_request.biometric_data_placeholder = biometric_data
+            
+            # Update document
+            document.status = 'signed'
+            store_signed_file(document, signed_pdf_path)
+            # The blob reference taken here is part of the transaction, and so is undone by a rollback
+            unstored_paths.remove(signed_pdf_path)
+            
+            log_action(
+                'document_signed_electronic',
+                user_id=signer.id if signer else None,
+                document_id=document.id,
+                details=f'Electronic signature by {envelope.signer_email} (envelope {envelope.id})',
+                ip_address=ip_address,
+                commit=False
+            )
+            
+            verification_urls[document.id] = url_for('signatures.verify_document', document_id=document.id, _external=True)
+        
+        envelope.status = 'signed'
+        envelope.signed_at = signed_at
+        
+        # Increment signed documents count for signer
+        if signer:
+            signer.increment_signed_documents(len(pending_requests), commit=False)
+        
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Documents signed successfully',
+            'envelope': envelope.to_dict(),
+            'verification_urls': verification_urls
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        remove_files(unstored_paths)
+        current_app.logger.error(f"Sign envelope error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @signatures_bp.route('/signature-requests/<int:request_id>', methods=['GET'])
 def get_signature_request(request_id):
     """Get signature request details (for signing page)"""
@@ -237,7 +641,12 @@ def get_signature_request(request_id):
 
 @signatures_bp.route('/documents/<int:document_id>/verify', methods=['GET'])
 def verify_document(document_id):
-    """Public endpoint to verify document authenticity"""
+    """Public endpoint to verify document authenticity
+    
+    Signatures, file integrity and the audit trail are cached per
+    verification version, so repeated scans of the QR code do not read the
+    signed file or the audit log.
+    """
     try:
         document = Document.query.get(document_id)
         
@@ -247,35 +656,42 @@ def verify_document(document_id):
         if document.status != 'signed':
             return jsonify({'error': 'Document is not signed'}), 400
         
-        # Get signature requests for this document
-        signature_requests = SignatureRequest.query.filter_by(
-            document_id=document_id,
-            status='signed'
-        ).all()
-        
-        # Get audit logs for this document
-        audit_logs = AuditLog.query.filter_by(document_id=document_id).order_by(AuditLog.timestamp.desc()).all()
+        version = document.verification_version
+        verified = get_cached_verification(document.id, version)
         
-        # Verify file integrity if signed file exists
-        file_integrity = False
-        if document.signed_path and os.path.exists(document.signed_path):
-            current_hash = calculate_sha256(document.signed_path)
-            file_integrity = (current_hash == document.sha256_hash)
+        if verified is None:
+            # Get signature requests for this document
+            signature_requests = SignatureRequest.query.filter_by(
+                document_id=document_id,
+                status='signed'
+            ).all()
+            
+            # Verify file integrity if signed file exists
+            file_integrity = False
+            if document.signed_path and get_storage().exists(document.signed_path):
+                current_hash = calculate_stored_sha256(document.signed_path)
+                file_integrity = (current_hash == document.sha256_hash)
+            
+            verified = {
+                'document': {
+                    'id': document.id,
+                    'filename': document.filename,
+                    'status': document.status,
+                    'sha256_hash': document.sha256_hash,
+                    'created_at': document.created_at.isoformat() if document.created_at else None,
+                    'updated_at': document.updated_at.isoformat() if document.updated_at else None
+                },
+                'signatures': [req.to_dict() for req in signature_requests],
+                'file_integrity': file_integrity,
+                # Verification accesses are left out, so scans do not grow the trail they return
+                'audit_trail': [log.to_dict() for log in AuditLog.query.filter(
+                    AuditLog.document_id == document_id,
+                    AuditLog.action_type != 'document_verification_accessed'
+                ).order_by(AuditLog.timestamp.desc())]
+            }
+            cache_verification(document.id, version, verified)
         
-        verification_data = {
-            'document': {
-                'id': document.id,
-                'filename': document.filename,
-                'status': document.status,
-                'sha256_hash': document.sha256_hash,
-                'created_at': document.created_at.isoformat() if document.created_at else None,
-                'updated_at': document.updated_at.isoformat() if document.updated_at else None
-            },
-            'signatures': [req.to_dict() for req in signature_requests],
-            'audit_trail': [log.to_dict() for log in audit_logs],
-            'file_integrity': file_integrity,
-            'verification_timestamp': datetime.utcnow().isoformat()
-        }
+        verification_data = dict(verified, verification_timestamp=datetime.utcnow().isoformat())
         
         # Log verification access
         log_action(
@@ -391,6 +807,7 @@ def cancel_signature_request(request_id):
         
         # Update status
         signature_request.status = 'rejected'
+        document.bump_verification_version()
         
         # Check if there are other pending requests for this document
         other_pending = SignatureRequest.query.filter_by(
@@ -0,0 +1,96 @@
+from celery import Celery, Task, shared_task
+
+# Periodic tasks run by celery beat: (task name, setting holding the interval in seconds)
+PERIODIC_TASKS = [
+    ('blobs.collect_garbage', 'BLOB_GC_INTERVAL'),
+    ('uploads.expire_sessions', 'UPLOAD_SESSION_EXPIRY_INTERVAL'),
+    ('conversions.expire_cache', 'DOCX_CONVERSION_CACHE_EXPIRY_INTERVAL'),
+    ('integrity.scrub', 'SCRUB_INTERVAL'),
+]
+
+
+def beat_schedule(app):
+    """Celery beat entries for the maintenance tasks; an interval of 0 leaves a task unscheduled"""
+    schedule = {}
+    for task_name, setting in PERIODIC_TASKS:
+        interval = app.config.get(setting, 3600)
+        if interval:
+            # A run still queued when the next one is due is dropped instead of piling up
+            schedule[task_name] = {'task': task_name, 'schedule': interval, 'options': {'expires': interval}}
+    return schedule
+
+
+def init_celery(app):
+    """Create the Celery application bound to the Flask app context
+
+    Workers run tasks inside ``app.app_context()`` so they can use the
+    database session and configuration exactly like the routes do. With
+    ``CELERY_TASK_ALWAYS_EAGER`` tasks run in-process (used for tests and
+    single-node deployments without a broker). Called from
+    ``Config.init_app``; the maintenance tasks are scheduled by running
+    ``celery beat`` (or a worker with ``--beat``) next to the workers.
+    """
+    class FlaskTask(Task):
+        def __call__(self, *args, **kwargs):
+            with app.app_context():
+                return self.run(*args, **kwargs)
+
+    celery_app = Celery(app.name, task_cls=FlaskTask)
+    celery_app.config_from_object({
+        'broker_url': app.config.get('CELERY_BROKER_URL') or app.config.get('REDIS_URL'),
+        'result_backend': app.config.get('CELERY_RESULT_BACKEND') or app.config.get('REDIS_URL'),
+        'task_always_eager': app.config.get('CELERY_TASK_ALWAYS_EAGER', False),
+        'task_store_eager_result': True,
+        'task_ignore_result': False,
+        'task_track_started': True,
+        'result_expires': 86400,  # 1 day
+        'beat_schedule': beat_schedule(app),
+    })
+    celery_app.set_default()
+    app.extensions['celery'] = celery_app
+    return celery_app
+
+
+@shared_task(name='signatures.sign_document')
+def sign_document_task(request_id, ip_address, geolocation, biometric_data, verification_url):
+    """Stamp the signed PDF and record the signature outside the web worker"""
+    from src.routes.signatures import complete_electronic_signature
+
+    error, status_code = complete_electronic_signature(
+        request_id, ip_address, geolocation, biometric_data, verification_url
+    )
+    if error:
+        return {'error': error, 'status_code': status_code}
+    return {'signature_request_id': request_id, 'verification_url': verification_url}
+
+
+@shared_task(name='blobs.collect_garbage')
+def collect_blob_garbage_task():
+    """Remove stored files that no document has referenced for the grace period"""
+    from src.utils.blob_store import collect_garbage
+
+    return {'removed': collect_garbage()}
+
+
+@shared_task(name='uploads.expire_sessions')
+def expire_upload_sessions_task():
+    """Discard resumable uploads that have been idle for UPLOAD_SESSION_TTL"""
+    from src.utils.chunked_upload import expire_upload_sessions
+
+    return {'expired': expire_upload_sessions()}
+
+
+@shared_task(name='conversions.expire_cache')
+def expire_conversion_cache_task():
+    """Trim the DOCX conversion cache by age and total size"""
+    from src.utils.docx_converter import expire_conversion_cache
+
+    return {'removed': expire_conversion_cache()}
+
+
+@shared_task(name='integrity.scrub')
+def scrub_integrity_task():
+    """Re-hash a slice of the stored files, resuming where the previous run stopped"""
+    from src.utils.scrubber import scrub_documents
+
+    return scrub_documents()
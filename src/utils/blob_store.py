@@ -0,0 +1,192 @@
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from src.models.user import Blob, db
+from src.utils.hashing import forget_file_hashes, remember_file_hash
+from src.utils.storage import get_storage
+
+# Orphan sweep looks up this many stored keys per query
+SWEEP_BATCH_SIZE = 500
+
+# Session.info key of the files to delete once the transaction commits
+PENDING_DELETES_KEY = 'blob_store_pending_deletes'
+
+def get_blob_folder():
+    """Root of the content-addressed store in the storage backend"""
+    if current_app.config.get('BLOB_FOLDER'):
+        return current_app.config['BLOB_FOLDER']
+    if current_app.config.get('STORAGE_BACKEND', 'local') == 's3':
+        return 'blobs'
+    return os.path.join(current_app.config.get('UPLOAD_FOLDER', 'uploads'), 'blobs')
+
+def blob_path(sha256_hash, ext=''):
+    """Storage key of a blob, fanned out as ab/cd/abcd....ext to keep directories small"""
+    return get_storage().join(get_blob_folder(), sha256_hash[:2], sha256_hash[2:4], f"{sha256_hash}{ext.lower()}")
+
+def blob_hash(path):
+    """Return the SHA-256 a stored path is keyed by, or None for files outside the store"""
+    if not path:
+        return None
+    sha256_hash, ext = os.path.splitext(os.path.basename(path))
+    if len(sha256_hash) != 64 or blob_path(sha256_hash, ext) != path:
+        return None
+    return sha256_hash
+
+def _acquire(sha256_hash, path, size):
+    """Add one reference to a blob row, creating it if needed; returns the blob path"""
+    updated = Blob.query.filter_by(sha256_hash=sha256_hash).update(
+        {Blob.ref_count: Blob.ref_count + 1, Blob.released_at: None},
+        synchronize_session=False
+    )
+    if updated:
+        return db.session.query(Blob.path).filter_by(sha256_hash=sha256_hash).scalar()
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(Blob(sha256_hash=sha256_hash, path=path, size=size, ref_count=1))
+        return path
+    except IntegrityError:
+        # Stored concurrently by another request, take a reference to that row
+        return _acquire(sha256_hash, path, size)
+
+def store_blob(file_path, sha256_hash, ext=''):
+    """Move a local file into the store and take a reference to it; returns the stored path
+
+    When the content is already stored the file is discarded. The reference
+    is added to the current session, so it is committed (or rolled back)
+    together with the document that holds the path.
+    """
+    storage = get_storage()
+    path = _acquire(sha256_hash, blob_path(sha256_hash, ext), os.path.getsize(file_path))
+
+    if storage.exists(path):
+        # Fresh mtime keeps the orphan sweep away from a blob that is referenced again
+        storage.touch(path)
+        os.remove(file_path)
+    else:
+        storage.save_file(file_path, path)
+        # The content was just hashed, so verifying the new blob later needs no read
+        remember_file_hash(path, sha256_hash)
+
+    return path
+
+def release_blob(path):
+    """Drop one reference to a stored path
+
+    Files outside the store (uploaded before it existed) are not shared and
+    are deleted once the current transaction commits, so a rollback keeps
+    them. Stored files are only removed by ``collect_garbage``.
+    """
+    sha256_hash = blob_hash(path)
+    if sha256_hash is None:
+        if path:
+            db.session.info.setdefault(PENDING_DELETES_KEY, []).append(path)
+        return
+
+    Blob.query.filter_by(sha256_hash=sha256_hash).filter(Blob.ref_count > 0).update(
+        {
+            Blob.ref_count: Blob.ref_count - 1,
+            Blob.released_at: case((Blob.ref_count <= 1, datetime.utcnow()), else_=Blob.released_at),
+        },
+        synchronize_session=False
+    )
+
+@event.listens_for(Session, 'after_commit')
+def _delete_released_files(session):
+    # Also fired when a savepoint is released, which commits nothing yet
+    if session.in_nested_transaction():
+        return
+    for path in session.info.pop(PENDING_DELETES_KEY, []):
+        try:
+            get_storage().delete(path)
+        except Exception as e:
+            current_app.logger.warning(f"Could not delete released file {path}: {str(e)}")
+
+@event.listens_for(Session, 'after_transaction_end')
+def _keep_released_files(session, transaction):
+    # A rolled back transaction did not release anything
+    if transaction.parent is None:
+        session.info.pop(PENDING_DELETES_KEY, None)
+
+def collect_garbage(grace_period=None):
+    """Delete blobs that have had no references for the grace period; returns files removed
+
+    Each file is moved aside before its row is deleted, and the row is only
+    deleted if it is still unreferenced. An upload of the same content that
+    races with the collector either keeps the row alive (and the file is
+    moved back) or finds the path free and stores its own copy. Only one
+    collector should run at a time.
+    """
+    if grace_period is None:
+        grace_period = current_app.config.get('BLOB_GC_GRACE_PERIOD', 86400)
+    storage = get_storage()
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_period)
+    removed = 0
+
+    candidates = db.session.query(Blob.sha256_hash, Blob.path).filter(
+        Blob.ref_count == 0,
+        Blob.released_at < cutoff
+    ).all()
+
+    for sha256_hash, path in candidates:
+        quarantine_path = f"{path}.{uuid.uuid4().hex}.gc"
+        if storage.exists(path):
+            storage.rename(path, quarantine_path)
+        else:
+            quarantine_path = None
+
+        deleted = Blob.query.filter_by(sha256_hash=sha256_hash, ref_count=0).filter(
+            Blob.released_at < cutoff
+        ).delete(synchronize_session=False)
+        if deleted:
+            forget_file_hashes([path])
+        db.session.commit()
+
+        if quarantine_path is None:
+            continue
+        if deleted or storage.exists(path):
+            storage.delete(quarantine_path)
+            removed += deleted
+        else:
+            storage.rename(quarantine_path, path)
+
+    return removed + _sweep_orphans(grace_period)
+
+def _sweep_orphans(grace_period):
+    """Remove stored files without a row (rolled back uploads, interrupted collections)"""
+    storage = get_storage()
+    cutoff_timestamp = time.time() - grace_period
+    removed = 0
+
+    stale = {}
+    for key, modified in storage.list(get_blob_folder()):
+        if modified < cutoff_timestamp:
+            stale[key] = os.path.basename(key).split('.', 1)[0]
+        if len(stale) >= SWEEP_BATCH_SIZE:
+            removed += _remove_orphans(storage, stale)
+            stale = {}
+
+    return removed + _remove_orphans(storage, stale)
+
+def _remove_orphans(storage, stale):
+    if not stale:
+        return 0
+
+    removed = 0
+    known = {
+        sha256_hash for (sha256_hash,) in db.session.query(Blob.sha256_hash).filter(
+            Blob.sha256_hash.in_(set(stale.values()))
+        )
+    }
+    for key, sha256_hash in stale.items():
+        # Leftover temporary and quarantined files are always removed
+        if key.endswith(('.tmp', '.gc')) or sha256_hash not in known:
+            storage.delete(key)
+            removed += 1
+
+    return removed
@@ -0,0 +1,288 @@
+import hashlib
+import os
+import posixpath
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+from src.models.user import UploadSession, db
+from src.utils.hashing import MerkleTreeBuilder
+from src.utils.ingest import INGEST_BUFFER_SIZE, SNIFF_SIZE, ingest_upload, sniff_mime_type
+from src.utils.storage import get_storage
+
+# Upload sessions whose running hash is kept in memory per worker process
+MAX_CACHED_HASHERS = 256
+
+# session id -> (offset, sha256 state and Merkle tree builder of the first offset bytes)
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+class ChunkError(Exception):
+    """Raised when a chunk cannot be appended at the requested offset"""
+
+class _StoredParts:
+    """Read the stored chunks of an upload one after another as a single stream"""
+
+    def __init__(self, storage, keys):
+        self.storage = storage
+        self.keys = iter(keys)
+        self.current = None
+
+    def read(self, size):
+        while True:
+            if self.current is None:
+                key = next(self.keys, None)
+                if key is None:
+                    return b''
+                self.current = self.storage.open(key)
+            data = self.current.read(size)
+            if data:
+                return data
+            self.current.close()
+            self.current = None
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+
+def stages_in_storage():
+    """Whether chunks are kept as objects in the storage backend instead of a local file
+
+    Instances using S3 share no filesystem, so a chunk may land on any of
+    them; each chunk is then stored as its own object (S3 cannot append) and
+    listed in ``UploadSession.parts``. With local storage the upload folder
+    is already shared by every instance and chunks go to one staging file.
+    """
+    return current_app.config.get('STORAGE_BACKEND', 'local') == 's3'
+
+def get_chunked_upload_folder():
+    """Directory (or S3 key prefix) holding partially received uploads"""
+    if stages_in_storage():
+        return 'chunked'
+    return os.path.join(current_app.config.get('UPLOAD_FOLDER', 'uploads'), 'chunked')
+
+def staging_path(upload_id):
+    return os.path.join(get_chunked_upload_folder(), f"{upload_id}.part")
+
+def part_key(upload_id, offset):
+    """Storage key of the chunk starting at offset, when chunks are staged in storage"""
+    return get_storage().join(get_chunked_upload_folder(), upload_id, f"{offset:016d}.part")
+
+def session_expiry():
+    return datetime.utcnow() + timedelta(seconds=current_app.config.get('UPLOAD_SESSION_TTL', 86400))
+
+def _take_hasher(upload_id, offset):
+    """Return the running hash and Merkle tree builder of the first offset bytes of an upload
+
+    Chunks normally arrive at the process that hashed the previous one; when
+    they do not (another worker, a restart) the hash is rebuilt from the
+    bytes already on disk.
+    """
+    with _hashers_lock:
+        cached = _hashers.pop(upload_id, None)
+    if cached is not None and cached[0] == offset:
+        return cached[1], cached[2]
+
+    hash_sha256 = hashlib.sha256()
+    merkle_tree = MerkleTreeBuilder()
+    remaining = offset
+    with open(staging_path(upload_id), 'rb') as f:
+        while remaining:
+            chunk = f.read(min(INGEST_BUFFER_SIZE, remaining))
+            if not chunk:
+                raise ChunkError("Staged upload is shorter than its recorded offset")
+            hash_sha256.update(chunk)
+            merkle_tree.update(chunk)
+            remaining -= len(chunk)
+    return hash_sha256, merkle_tree
+
+def _keep_hasher(upload_id, offset, hash_sha256, merkle_tree):
+    with _hashers_lock:
+        _hashers[upload_id] = (offset, hash_sha256, merkle_tree)
+        while len(_hashers) > MAX_CACHED_HASHERS:
+            _hashers.popitem(last=False)
+
+def _forget_hasher(upload_id):
+    with _hashers_lock:
+        _hashers.pop(upload_id, None)
+
+def create_upload_session(user_id, filename, total_size):
+    """Start a resumable upload; the session is added to the current db session"""
+    upload = UploadSession(
+        user_id=user_id,
+        filename=filename,
+        total_size=total_size,
+        received_size=0,
+        expires_at=session_expiry()
+    )
+    db.session.add(upload)
+    db.session.flush()
+
+    if stages_in_storage():
+        upload.parts = []
+        return upload
+
+    os.makedirs(get_chunked_upload_folder(), exist_ok=True)
+    open(staging_path(upload.id), 'wb').close()
+    _keep_hasher(upload.id, 0, hashlib.sha256(), MerkleTreeBuilder())
+    return upload
+
+def append_chunk(upload, offset, length, stream):
+    """Write length bytes from stream at offset and advance the session
+
+    The caller holds the session row lock. The offset only advances once the
+    whole chunk is on disk, so an interrupted chunk is simply sent again.
+    """
+    if offset != upload.received_size:
+        raise ChunkError(f"Expected offset {upload.received_size}")
+    if offset + length > upload.total_size:
+        raise ChunkError("Chunk extends past the declared upload size")
+
+    if stages_in_storage():
+        _store_part(upload, offset, length, stream)
+        upload.received_size = offset + length
+        upload.expires_at = session_expiry()
+        return upload.received_size
+
+    hash_sha256, merkle_tree = _take_hasher(upload.id, offset)
+    written = 0
+
+    with open(staging_path(upload.id), 'r+b') as output_file:
+        output_file.seek(offset)
+        while written < length:
+            chunk = stream.read(min(INGEST_BUFFER_SIZE, length - written))
+            if not chunk:
+                break
+            hash_sha256.update(chunk)
+            merkle_tree.update(chunk)
+            output_file.write(chunk)
+            written += len(chunk)
+        # Bytes left over from an earlier interrupted attempt are dropped
+        output_file.truncate()
+
+    if written != length:
+        raise ChunkError("Chunk ended before its declared length")
+
+    upload.received_size = offset + length
+    upload.expires_at = session_expiry()
+    _keep_hasher(upload.id, upload.received_size, hash_sha256, merkle_tree)
+    return upload.received_size
+
+def _store_part(upload, offset, length, stream):
+    """Save one chunk as a storage object and record it in the session"""
+    file_descriptor, temp_path = tempfile.mkstemp(prefix='zeropapel-chunk-')
+    written = 0
+    try:
+        # Spooled to disk first, so a short chunk never reaches storage
+        with os.fdopen(file_descriptor, 'wb') as output_file:
+            while written < length:
+                chunk = stream.read(min(INGEST_BUFFER_SIZE, length - written))
+                if not chunk:
+                    break
+                output_file.write(chunk)
+                written += len(chunk)
+
+        if written != length:
+            raise ChunkError("Chunk ended before its declared length")
+
+        # A chunk re-sent after a failed commit overwrites its earlier copy
+        get_storage().save_file(temp_path, part_key(upload.id, offset))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    # Assigned as a new list so the JSON column is marked as changed
+    upload.parts = (upload.parts or []) + [[offset, length]]
+
+def finish_upload(upload, file_path):
+    """Write a fully received upload to file_path and return its ingest result
+
+    The result has ``sha256_hash``, ``size``, ``mime_type`` and
+    ``merkle_tree``, as returned by ``ingest_upload``. The staged
+    chunks are left in place until ``discard_upload``, so a completion that
+    fails afterwards can be retried.
+    """
+    if stages_in_storage():
+        # Downloaded, hashed and sniffed in one pass
+        storage = get_storage()
+        parts = _StoredParts(storage, [part_key(upload.id, offset) for offset, _ in upload.parts or []])
+        try:
+            ingested = ingest_upload(parts, file_path)
+        finally:
+            parts.close()
+        if ingested['size'] != upload.received_size:
+            os.remove(file_path)
+            raise ChunkError("Stored chunks do not add up to the received size")
+        return ingested
+
+    # The hashes were built while the chunks arrived; only the head is read again to sniff the type
+    hash_sha256, merkle_tree = _take_hasher(upload.id, upload.received_size)
+
+    with open(staging_path(upload.id), 'rb') as f:
+        head = f.read(SNIFF_SIZE)
+
+    try:
+        os.link(staging_path(upload.id), file_path)
+    except OSError:
+        shutil.copyfile(staging_path(upload.id), file_path)
+
+    return {
+        'sha256_hash': hash_sha256.hexdigest(),
+        'size': upload.received_size,
+        'mime_type': sniff_mime_type(head),
+        'merkle_tree': merkle_tree.tree(),
+    }
+
+def discard_upload(upload_id):
+    """Remove the staged bytes of an upload"""
+    _forget_hasher(upload_id)
+    if stages_in_storage():
+        storage = get_storage()
+        for key, _ in list(storage.list(storage.join(get_chunked_upload_folder(), upload_id))):
+            storage.delete(key)
+        return
+
+    try:
+        os.remove(staging_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+def expire_upload_sessions():
+    """Delete expired upload sessions and their staged files; returns sessions removed"""
+    expired = [
+        upload_id for (upload_id,) in db.session.query(UploadSession.id).filter(
+            UploadSession.expires_at < datetime.utcnow()
+        )
+    ]
+    for upload_id in expired:
+        discard_upload(upload_id)
+    if expired:
+        UploadSession.query.filter(UploadSession.id.in_(expired)).delete(synchronize_session=False)
+        db.session.commit()
+
+    # Staged files whose session was never committed
+    folder = get_chunked_upload_folder()
+    cutoff_timestamp = time.time() - current_app.config.get('UPLOAD_SESSION_TTL', 86400)
+    if stages_in_storage():
+        last_modified = {}
+        for key, modified in get_storage().list(folder):
+            upload_id = posixpath.basename(posixpath.dirname(key))
+            last_modified[upload_id] = max(modified, last_modified.get(upload_id, 0))
+        for upload_id, modified in last_modified.items():
+            if modified < cutoff_timestamp and UploadSession.query.get(upload_id) is None:
+                discard_upload(upload_id)
+    elif os.path.isdir(folder):
+        for filename in os.listdir(folder):
+            path = os.path.join(folder, filename)
+            upload_id = filename[:-len('.part')]
+            try:
+                if os.path.getmtime(path) < cutoff_timestamp and UploadSession.query.get(upload_id) is None:
+                    discard_upload(upload_id)
+            except FileNotFoundError:
+                continue
+
+    return len(expired)
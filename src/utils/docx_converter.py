@@ -0,0 +1,294 @@
+import atexit
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from flask import current_app
+from src.utils.hashing import sha256_file
+
+_pool = None
+_pool_lock = threading.Lock()
+
+class ConverterBusy(Exception):
+    """Raised when no LibreOffice worker becomes free within the queue timeout"""
+
+def _free_port():
+    """Ask the OS for an unused local TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _port_open(port):
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+class LibreOfficeWorker:
+    """A persistent headless LibreOffice (unoserver) process serving conversions"""
+
+    def __init__(self, unoserver_command, unoconvert_command, max_jobs, startup_timeout):
+        self.unoserver_command = unoserver_command
+        self.unoconvert_command = unoconvert_command
+        self.max_jobs = max_jobs
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.profile_dir = None
+        self.port = None
+        self.jobs = 0
+
+    def start(self):
+        """Start the LibreOffice process with its own profile and wait until it accepts jobs"""
+        # Each instance needs a private profile, concurrent instances sharing one lock up
+        self.profile_dir = tempfile.mkdtemp(prefix='zeropapel-lo-')
+        self.port = _free_port()
+        self.process = subprocess.Popen(
+            [
+                self.unoserver_command,
+                '--interface', '127.0.0.1',
+                '--port', str(self.port),
+                '--uno-port', str(_free_port()),
+                '--user-installation', f"file://{self.profile_dir}",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+        self.jobs = 0
+
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            if _port_open(self.port):
+                return
+            time.sleep(0.2)
+
+        self.stop()
+        raise RuntimeError("LibreOffice worker did not start")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            # unoserver spawns soffice, so the whole process group is terminated
+            try:
+                os.killpg(self.process.pid, 15)
+                self.process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                try:
+                    os.killpg(self.process.pid, 9)
+                except OSError:
+                    pass
+        self.process = None
+        if self.profile_dir:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+            self.profile_dir = None
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def convert(self, source_path, pdf_path, timeout):
+        """Convert one file, restarting the worker after a failure, a timeout or max_jobs conversions"""
+        if not self.alive():
+            self.start()
+
+        try:
+            subprocess.run(
+                [
+                    self.unoconvert_command,
+                    '--host', '127.0.0.1',
+                    '--port', str(self.port),
+                    '--convert-to', 'pdf',
+                    source_path,
+                    pdf_path,
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                timeout=timeout,
+                check=True
+            )
+        except Exception:
+            # A hung or crashed soffice would poison every later job
+            self.stop()
+            raise
+
+        self.jobs += 1
+        if self.max_jobs and self.jobs >= self.max_jobs:
+            # LibreOffice leaks memory over time, so long-lived workers are recycled
+            self.stop()
+
+class DocxConverterPool:
+    """Fixed set of warm LibreOffice workers, each running one conversion at a time"""
+
+    def __init__(self, size, queue_timeout, **worker_options):
+        self.queue_timeout = queue_timeout
+        self.idle = queue.Queue()
+        self.workers = [LibreOfficeWorker(**worker_options) for _ in range(size)]
+        for worker in self.workers:
+            self.idle.put(worker)
+
+    def convert(self, source_path, pdf_path, timeout):
+        try:
+            worker = self.idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            raise ConverterBusy(f"All {len(self.workers)} LibreOffice workers are busy")
+
+        try:
+            worker.convert(source_path, pdf_path, timeout)
+        finally:
+            self.idle.put(worker)
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.stop()
+
+def get_converter_pool():
+    """Return the shared LibreOffice pool, or None when DOCX_CONVERTER_POOL_SIZE is 0"""
+    global _pool
+
+    size = current_app.config.get('DOCX_CONVERTER_POOL_SIZE', 0)
+    if not size:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = DocxConverterPool(
+                size,
+                current_app.config.get('DOCX_CONVERTER_QUEUE_TIMEOUT', 30),
+                unoserver_command=current_app.config.get('UNOSERVER_COMMAND', 'unoserver'),
+                unoconvert_command=current_app.config.get('UNOCONVERT_COMMAND', 'unoconvert'),
+                max_jobs=current_app.config.get('DOCX_CONVERTER_MAX_JOBS', 200),
+                startup_timeout=current_app.config.get('DOCX_CONVERTER_STARTUP_TIMEOUT', 30)
+            )
+        return _pool
+
+def reset_converter_pool():
+    """Stop all LibreOffice workers; the next conversion starts a fresh pool"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = None
+
+atexit.register(reset_converter_pool)
+
+def get_conversion_cache_folder():
+    """Directory holding converted PDFs, keyed by the SHA-256 of the source file"""
+    return current_app.config.get('DOCX_CONVERSION_CACHE_FOLDER') or os.path.join(
+        current_app.config.get('UPLOAD_FOLDER', 'uploads'), 'conversions'
+    )
+
+def expire_conversion_cache(max_age=None, max_bytes=None):
+    """Delete cached conversions unused for max_age seconds, then the oldest beyond max_bytes
+
+    Cache hits refresh the modification time, so it tracks last use.
+    Returns the number of files removed.
+    """
+    if max_age is None:
+        max_age = current_app.config.get('DOCX_CONVERSION_CACHE_MAX_AGE', 604800)
+    if max_bytes is None:
+        max_bytes = current_app.config.get('DOCX_CONVERSION_CACHE_MAX_BYTES', 1073741824)
+
+    entries = []
+    for directory, _, filenames in os.walk(get_conversion_cache_folder()):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    # Oldest first; files left behind by interrupted conversions age out too
+    entries.sort()
+    cutoff = time.time() - max_age
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for mtime, size, path in entries:
+        if mtime >= cutoff and (not max_bytes or total <= max_bytes):
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+
+    return removed
+
+def _convert_once(source_path, pdf_path, timeout):
+    """Convert with a short-lived soffice process (used when no pool is configured)"""
+    output_dir = tempfile.mkdtemp(prefix='zeropapel-convert-')
+    profile_dir = tempfile.mkdtemp(prefix='zeropapel-lo-')
+    try:
+        subprocess.run(
+            [
+                current_app.config.get('SOFFICE_COMMAND', 'soffice'),
+                f"-env:UserInstallation=file://{profile_dir}",
+                '--headless',
+                '--convert-to', 'pdf',
+                '--outdir', output_dir,
+                source_path,
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=timeout,
+            check=True
+        )
+        name = os.path.splitext(os.path.basename(source_path))[0]
+        shutil.move(os.path.join(output_dir, f"{name}.pdf"), pdf_path)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        shutil.rmtree(profile_dir, ignore_errors=True)
+
+def convert_docx_to_pdf(source_path, pdf_path, source_hash=None):
+    """Convert a DOCX/DOC file to PDF with LibreOffice
+
+    Conversions are cached by the SHA-256 of the source, so uploading the
+    same template again copies the cached PDF instead of converting. Pass
+    ``source_hash`` when it is already known to skip hashing the source.
+    """
+    try:
+        source_hash = source_hash or sha256_file(source_path)
+        cached_path = os.path.join(get_conversion_cache_folder(), source_hash[:2], f"{source_hash}.pdf")
+
+        if os.path.exists(cached_path):
+            shutil.copyfile(cached_path, pdf_path)
+            # Keeps frequently used templates out of the expiry sweep
+            os.utime(cached_path)
+            return True
+
+        timeout = current_app.config.get('DOCX_CONVERTER_TIMEOUT', 60)
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        temp_path = f"{cached_path}.{uuid.uuid4().hex}.tmp.pdf"
+
+        try:
+            pool = get_converter_pool()
+            if pool is None:
+                _convert_once(source_path, temp_path, timeout)
+            else:
+                pool.convert(source_path, temp_path, timeout)
+
+            if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
+                raise RuntimeError("LibreOffice produced no output")
+
+            # Concurrent conversions of the same source simply replace each other
+            os.replace(temp_path, cached_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        shutil.copyfile(cached_path, pdf_path)
+        return True
+
+    except subprocess.TimeoutExpired:
+        current_app.logger.error(f"DOCX to PDF conversion timed out: {source_path}")
+        return False
+    except Exception as e:
+        current_app.logger.error(f"DOCX to PDF conversion error: {str(e)}")
+        return False
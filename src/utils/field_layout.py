@@ -0,0 +1,121 @@
+import uuid
+from src.models.user import Document, DocumentField, db
+
+FIELD_TYPES = ('signature', 'date', 'full_name', 'checkbox')
+
+# Length of DocumentField.client_id
+MAX_CLIENT_ID_LENGTH = 64
+
+# Columns a layout save can change
+FIELD_COLUMNS = ('field_type', 'page_number', 'x_coord', 'y_coord', 'width', 'height')
+
+class LayoutConflict(Exception):
+    """Raised when the layout was saved by someone else since the given version"""
+
+    def __init__(self, current_version):
+        super().__init__(f"Field layout is at version {current_version}")
+        self.current_version = current_version
+
+def _coordinate(value):
+    # Stored as Numeric(10, 2); rounding here keeps unchanged fields from looking dirty
+    return None if value is None else round(float(value), 2)
+
+def normalize_field(field_data):
+    """Return the column values of a field from editor data, raising ValueError if invalid"""
+    if field_data.get('field_type') not in FIELD_TYPES:
+        raise ValueError(f"Invalid field type: {field_data.get('field_type')}")
+    try:
+        return {
+            'field_type': field_data['field_type'],
+            'page_number': int(field_data['page_number']),
+            'x_coord': _coordinate(field_data['x_coord']),
+            'y_coord': _coordinate(field_data['y_coord']),
+            'width': _coordinate(field_data.get('width')),
+            'height': _coordinate(field_data.get('height')),
+        }
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Fields need a page_number, x_coord and y_coord")
+
+def _stored_values(row):
+    return {
+        'field_type': row.field_type,
+        'page_number': row.page_number,
+        'x_coord': _coordinate(row.x_coord),
+        'y_coord': _coordinate(row.y_coord),
+        'width': _coordinate(row.width),
+        'height': _coordinate(row.height),
+    }
+
+def _bump_version(document_id, version):
+    """Advance the layout version, only from the expected one when given; returns the new version"""
+    query = Document.query.filter_by(id=document_id)
+    if version is not None:
+        query = query.filter_by(fields_version=version)
+
+    # The conditional update also locks the document row until commit, serializing concurrent saves
+    if not query.update({Document.fields_version: Document.fields_version + 1}, synchronize_session=False):
+        raise LayoutConflict(db.session.query(Document.fields_version).filter_by(id=document_id).scalar())
+
+    return db.session.query(Document.fields_version).filter_by(id=document_id).scalar()
+
+def save_field_layout(document, upserts, deletes=(), version=None, replace=False):
+    """Apply a field layout change with set-based inserts, updates and deletes
+
+    ``upserts`` are field dicts keyed by their ``client_id`` (one is
+    generated when missing); only fields whose values differ from the stored
+    row are written. With ``replace`` the upserts are the whole layout and
+    every other field is deleted, otherwise only the ``deletes`` client ids
+    are. ``version`` is the layout version the change was made against; a
+    mismatch raises LayoutConflict. Nothing is committed.
+    """
+    new_version = _bump_version(document.id, version)
+
+    existing = {}
+    untracked = []
+    rows = db.session.query(
+        DocumentField.id, DocumentField.client_id, *[getattr(DocumentField, column) for column in FIELD_COLUMNS]
+    ).filter_by(document_id=document.id)
+    for row in rows:
+        if row.client_id is None:
+            # Saved before fields had client ids
+            untracked.append(row.id)
+        else:
+            existing[row.client_id] = row
+
+    inserts = []
+    updates = []
+    seen = set()
+    for field_data in upserts:
+        client_id = str(field_data.get('client_id') or uuid.uuid4().hex)
+        if client_id in seen:
+            raise ValueError(f"Duplicate field client_id: {client_id}")
+        seen.add(client_id)
+
+        values = normalize_field(field_data)
+        row = existing.get(client_id)
+        if row is None:
+            inserts.append(dict(values, document_id=document.id, client_id=client_id))
+        elif values != _stored_values(row):
+            updates.append(dict(values, id=row.id))
+
+    if replace:
+        delete_ids = untracked + [row.id for client_id, row in existing.items() if client_id not in seen]
+    else:
+        delete_ids = [existing[str(client_id)].id for client_id in deletes if str(client_id) in existing and str(client_id) not in seen]
+
+    if delete_ids:
+        DocumentField.query.filter(
+            DocumentField.document_id == document.id,
+            DocumentField.id.in_(delete_ids)
+        ).delete(synchronize_session=False)
+    if updates:
+        db.session.bulk_update_mappings(DocumentField, updates)
+    if inserts:
+        db.session.bulk_insert_mappings(DocumentField, inserts)
+
+    return {
+        'version': new_version,
+        'inserted': len(inserts),
+        'updated': len(updates),
+        'deleted': len(delete_ids),
+    }
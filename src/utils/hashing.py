@@ -0,0 +1,200 @@
+import hashlib
+import mmap
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+from src.models.user import FileHash, db
+from src.utils.storage import LocalStorage, get_storage
+
+# hashlib releases the GIL while hashing buffers this large, so hashing
+# threads and request threads do not block each other
+HASH_BUFFER_SIZE = 8 * 1024 * 1024  # 8MB
+
+# Default chunk size of the Merkle trees stored with documents
+MERKLE_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+_chunk_pool = None
+_chunk_pool_lock = threading.Lock()
+
+def _update_mapped(hash_sha256, file_obj):
+    """Feed a local file to the hash through a memory map, without copying it into Python"""
+    with mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if hasattr(mapped, 'madvise'):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(mapped) as view:
+            for offset in range(0, len(view), HASH_BUFFER_SIZE):
+                hash_sha256.update(view[offset:offset + HASH_BUFFER_SIZE])
+
+def sha256_file(file_path):
+    """SHA-256 of a local file; raises OSError if it cannot be read"""
+    hash_sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        # Empty files cannot be mapped
+        if os.fstat(f.fileno()).st_size:
+            _update_mapped(hash_sha256, f)
+    return hash_sha256.hexdigest()
+
+def sha256_stream(stream):
+    """SHA-256 of a binary stream, read in large chunks"""
+    hash_sha256 = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(HASH_BUFFER_SIZE), b''):
+        hash_sha256.update(chunk)
+    return hash_sha256.hexdigest()
+
+def _hash_stored(storage, key):
+    if isinstance(storage, LocalStorage):
+        return sha256_file(key)
+    with storage.open(key) as stream:
+        return sha256_stream(stream)
+
+def _remember(key, size, mtime_ns, sha256_hash):
+    """Record a digest in the hash cache; it is committed with the caller's transaction"""
+    try:
+        with db.session.begin_nested():
+            db.session.merge(FileHash(key=key, size=size, mtime_ns=mtime_ns, sha256_hash=sha256_hash, hashed_at=datetime.utcnow()))
+    except Exception as e:
+        # A concurrent writer recorded the same file; the cache is best effort
+        current_app.logger.warning(f"Could not cache hash of {key}: {str(e)}")
+
+def stored_file_hash(key, use_cache=False):
+    """SHA-256 of a file in document storage
+
+    The bytes are read by default, so tampering that restored the file size
+    and modification time is still detected; the digest refreshes the
+    cache. Pass ``use_cache=True`` to reuse a cached digest while the size
+    and modification time are unchanged, where a stale answer is harmless.
+    """
+    storage = get_storage()
+    size, mtime_ns = storage.stat(key)
+
+    if use_cache:
+        cached = FileHash.query.get(key)
+        if cached is not None and cached.size == size and cached.mtime_ns == mtime_ns:
+            return cached.sha256_hash
+
+    sha256_hash = _hash_stored(storage, key)
+    _remember(key, size, mtime_ns, sha256_hash)
+    return sha256_hash
+
+def remember_file_hash(key, sha256_hash):
+    """Seed the cache with a digest already known for a freshly stored file"""
+    size, mtime_ns = get_storage().stat(key)
+    _remember(key, size, mtime_ns, sha256_hash)
+
+def forget_file_hashes(keys):
+    """Drop cached digests of files that were removed from storage"""
+    keys = list(keys)
+    if keys:
+        FileHash.query.filter(FileHash.key.in_(keys)).delete(synchronize_session=False)
+
+def _get_chunk_pool():
+    """Shared threads hashing Merkle chunks; MERKLE_WORKERS defaults to the CPU count"""
+    global _chunk_pool
+
+    with _chunk_pool_lock:
+        if _chunk_pool is None:
+            workers = current_app.config.get('MERKLE_WORKERS') or os.cpu_count() or 4
+            _chunk_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='merkle')
+        return _chunk_pool
+
+def _leaf_hash(data):
+    # Leaves and inner nodes are prefixed differently (RFC 6962), so one cannot pass for the other
+    hash_sha256 = hashlib.sha256(b'\x00')
+    hash_sha256.update(data)
+    return hash_sha256.hexdigest()
+
+def merkle_root(leaves):
+    """Root digest of a Merkle tree over leaf digests; an odd node is promoted to the next level"""
+    level = [bytes.fromhex(leaf) for leaf in leaves] or [bytes.fromhex(_leaf_hash(b''))]
+    while len(level) > 1:
+        next_level = [hashlib.sha256(b'\x01' + level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    return level[0].hex()
+
+class MerkleTreeBuilder:
+    """Merkle tree of data fed in pieces of any size, so it is built while a file is written"""
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or current_app.config.get('MERKLE_CHUNK_SIZE', MERKLE_CHUNK_SIZE)
+        self.leaves = []
+        self._leaf = hashlib.sha256(b'\x00')
+        self._leaf_size = 0
+
+    def update(self, data):
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.chunk_size - self._leaf_size)
+            self._leaf.update(view[:take])
+            self._leaf_size += take
+            view = view[take:]
+            if self._leaf_size == self.chunk_size:
+                self.leaves.append(self._leaf.hexdigest())
+                self._leaf = hashlib.sha256(b'\x00')
+                self._leaf_size = 0
+
+    def tree(self):
+        """The record stored by ``Document.set_merkle_tree``: ``root``, ``chunk_size`` and ``leaves``"""
+        leaves = list(self.leaves)
+        # A trailing partial chunk is a leaf of its own; an empty file has one empty leaf
+        if self._leaf_size or not leaves:
+            leaves.append(self._leaf.hexdigest())
+        return {'root': merkle_root(leaves), 'chunk_size': self.chunk_size, 'leaves': leaves}
+
+def sha256_file_with_tree(file_path, chunk_size=None):
+    """SHA-256 and Merkle tree of a local file from a single read of it
+
+    The chunks are hashed in parallel on the Merkle threads while this
+    thread hashes the whole file from the same memory map. Returns
+    ``(sha256_hash, tree)``; raises OSError if the file cannot be read.
+    """
+    chunk_size = chunk_size or current_app.config.get('MERKLE_CHUNK_SIZE', MERKLE_CHUNK_SIZE)
+    hash_sha256 = hashlib.sha256()
+
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            leaves = [_leaf_hash(b'')]
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    digests = _get_chunk_pool().map(
+                        lambda offset: _leaf_hash(view[offset:offset + chunk_size]),
+                        range(0, size, chunk_size)
+                    )
+                    for offset in range(0, size, HASH_BUFFER_SIZE):
+                        hash_sha256.update(view[offset:offset + HASH_BUFFER_SIZE])
+                    leaves = list(digests)
+
+    return hash_sha256.hexdigest(), {'root': merkle_root(leaves), 'chunk_size': chunk_size, 'leaves': leaves}
+
+def chunks_for_range(start, stop, chunk_size):
+    """Indexes of the chunks holding bytes start to stop (exclusive)"""
+    return range(start // chunk_size, max(start, stop - 1) // chunk_size + 1)
+
+def find_corrupt_chunks(key, leaves, chunk_size, indexes=None):
+    """Indexes of chunks of a stored file that no longer match their leaf digests
+
+    Chunks are read with ranged reads and hashed in parallel. Only
+    ``indexes`` are checked when given. Chunks missing from a shrunken file,
+    or added to a grown one, are reported as corrupt.
+    """
+    storage = get_storage()
+    size, _ = storage.stat(key)
+    chunk_count = max(1, -(-size // chunk_size))
+    if indexes is None:
+        indexes = range(max(chunk_count, len(leaves)))
+
+    indexes = sorted(set(indexes))
+    present = [index for index in indexes if index < chunk_count and index < len(leaves)]
+    corrupt = [index for index in indexes if index >= chunk_count or index >= len(leaves)]
+
+    digests = _get_chunk_pool().map(
+        lambda index: _leaf_hash(storage.read_range(key, index * chunk_size, chunk_size)),
+        present
+    )
+    corrupt.extend(index for index, digest in zip(present, digests) if digest != leaves[index])
+    return sorted(corrupt)
@@ -0,0 +1,60 @@
+import hashlib
+import os
+from src.utils.hashing import MerkleTreeBuilder
+
+INGEST_BUFFER_SIZE = 1024 * 1024  # 1MB
+SNIFF_SIZE = 8192
+
+PDF_MIME_TYPE = 'application/pdf'
+DOCX_MIME_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+DOC_MIME_TYPE = 'application/msword'
+ZIP_MIME_TYPE = 'application/zip'
+
+# Sniffed types accepted for each allowed extension
+EXTENSION_MIME_TYPES = {
+    'pdf': {PDF_MIME_TYPE},
+    # DOCX entries are not always in the first bytes; LibreOffice rejects other ZIP files
+    'docx': {DOCX_MIME_TYPE, ZIP_MIME_TYPE},
+    'doc': {DOC_MIME_TYPE},
+}
+
+def sniff_mime_type(head):
+    """Detect the document type from the first bytes of a file"""
+    # Readers accept the PDF header anywhere in the first 1024 bytes
+    if b'%PDF-' in head[:1024]:
+        return PDF_MIME_TYPE
+    if head.startswith(b'PK\x03\x04'):
+        if b'word/' in head or b'[Content_Types].xml' in head:
+            return DOCX_MIME_TYPE
+        return ZIP_MIME_TYPE
+    if head.startswith(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'):  # OLE2 compound file
+        return DOC_MIME_TYPE
+    return None
+
+def ingest_upload(stream, staging_path):
+    """Write an upload to disk while hashing and sniffing it in the same pass
+
+    Returns a dict with ``sha256_hash``, ``size``, ``mime_type`` and the
+    ``merkle_tree`` of the file.
+    """
+    hash_sha256 = hashlib.sha256()
+    merkle_tree = MerkleTreeBuilder()
+    head = b''
+    size = 0
+
+    os.makedirs(os.path.dirname(staging_path) or '.', exist_ok=True)
+    with open(staging_path, 'wb') as output_file:
+        for chunk in iter(lambda: stream.read(INGEST_BUFFER_SIZE), b''):
+            hash_sha256.update(chunk)
+            merkle_tree.update(chunk)
+            if len(head) < SNIFF_SIZE:
+                head += chunk[:SNIFF_SIZE - len(head)]
+            output_file.write(chunk)
+            size += len(chunk)
+
+    return {
+        'sha256_hash': hash_sha256.hexdigest(),
+        'size': size,
+        'mime_type': sniff_mime_type(head),
+        'merkle_tree': merkle_tree.tree(),
+    }
@@ -0,0 +1,136 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from flask import current_app
+from src.models.user import Document, db
+from src.utils.hashing import find_corrupt_chunks, merkle_root
+from src.utils.security import calculate_stored_sha256
+from src.utils.storage import get_storage
+
+# Documents fetched per database round trip while checking
+INTEGRITY_CHECK_BATCH_SIZE = 500
+
+def integrity_check_query(document_ids=None, user_id=None):
+    """Columns needed to check documents, by id; all signed documents when no ids are given"""
+    query = db.session.query(
+        Document.id, Document.filename, Document.status, Document.sha256_hash, Document.signed_path
+    )
+    if document_ids:
+        query = query.filter(Document.id.in_(document_ids))
+    else:
+        query = query.filter(Document.signed_path.isnot(None))
+    if user_id is not None:
+        query = query.filter(Document.user_id == user_id)
+    return query.order_by(Document.id)
+
+def check_document_file(app, document, deep=False, quick=False):
+    """Compare the signed file of a document with its stored hash; runs on a worker thread
+
+    The file is re-read unless ``quick`` trusts a digest cached while its
+    size and modification time are unchanged. A deep check of a document
+    with a Merkle tree verifies every chunk instead of the whole-file hash.
+    Mismatching chunks are reported in ``corrupt_chunks`` either way.
+    """
+    result = {
+        'document_id': document['id'],
+        'filename': document['filename'],
+        'status': document['status'],
+        'stored_hash': document['sha256_hash'],
+        'current_hash': None,
+        'integrity_valid': False,
+        'file_exists': False,
+        'corrupt_chunks': [],
+        'error': None
+    }
+
+    # Each worker has its own app context, and with it its own database session
+    with app.app_context():
+        try:
+            # Check if signed file exists
+            if document['signed_path'] and get_storage().exists(document['signed_path']):
+                result['file_exists'] = True
+                tree = db.session.query(
+                    Document.merkle_root, Document.merkle_chunk_size, Document.merkle_leaves
+                ).filter_by(id=document['id']).first()
+                has_tree = bool(tree and tree.merkle_leaves)
+
+                if deep and has_tree:
+                    # Chunks are read and hashed in parallel instead of streaming the whole file
+                    result['verified_by'] = 'merkle'
+                    corrupt = find_corrupt_chunks(document['signed_path'], tree.merkle_leaves, tree.merkle_chunk_size)
+                    result['integrity_valid'] = not corrupt and merkle_root(tree.merkle_leaves) == tree.merkle_root
+                    if corrupt:
+                        # Refresh the cached digest so later quick checks see the damage too
+                        result['current_hash'] = calculate_stored_sha256(document['signed_path'])
+                else:
+                    # Calculate current hash
+                    current_hash = calculate_stored_sha256(document['signed_path'], use_cache=quick and not deep)
+                    result['current_hash'] = current_hash
+
+                    # Compare hashes
+                    if current_hash and document['sha256_hash']:
+                        result['integrity_valid'] = (current_hash == document['sha256_hash'])
+
+                    # Locate the damage within the file
+                    corrupt = []
+                    if has_tree and current_hash and not result['integrity_valid']:
+                        corrupt = find_corrupt_chunks(document['signed_path'], tree.merkle_leaves, tree.merkle_chunk_size)
+
+                if corrupt:
+                    chunk_size = tree.merkle_chunk_size
+                    result['corrupt_chunks'] = [
+                        {'index': index, 'start': index * chunk_size, 'end': (index + 1) * chunk_size - 1}
+                        for index in corrupt
+                    ]
+
+            else:
+                result['error'] = 'Signed file not found'
+
+            # Keep digests cached by the check
+            db.session.commit()
+
+        except Exception as e:
+            db.session.rollback()
+            result['error'] = str(e)
+
+    return result
+
+def iter_integrity_results(query, deep=False, quick=False):
+    """Check documents on a bounded thread pool, yielding results as files finish
+
+    Rows are read with ``yield_per`` and at most a few batches of work are
+    queued, so memory use does not grow with the number of documents.
+    """
+    app = current_app._get_current_object()
+    workers = max(1, current_app.config.get('INTEGRITY_CHECK_WORKERS', 4))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='integrity-check')
+    pending = set()
+
+    try:
+        for row in query.yield_per(INTEGRITY_CHECK_BATCH_SIZE):
+            pending.add(executor.submit(check_document_file, app, row._asdict(), deep, quick))
+            if len(pending) >= workers * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    finally:
+        # A client that disconnects mid-stream does not leave queued hashing behind
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def summarize_integrity_result(summary, result):
+    """Add one result to running summary counts"""
+    summary['total_checked'] += 1
+    if result['integrity_valid']:
+        summary['valid'] += 1
+    elif result['file_exists']:
+        summary['invalid'] += 1
+    else:
+        summary['missing_files'] += 1
+    return summary
+
+def empty_integrity_summary():
+    return {'total_checked': 0, 'valid': 0, 'invalid': 0, 'missing_files': 0}
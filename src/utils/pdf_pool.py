@@ -0,0 +1,154 @@
+import multiprocessing
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import wraps
+from flask import Flask, current_app
+
+_pool = None
+_pool_lock = threading.Lock()
+
+class PdfPoolBusy(Exception):
+    """Raised when the PDF pool queue stays full for longer than the queue timeout"""
+
+class PdfProcessPool:
+    """Process pool for CPU-bound PDF work with a bounded number of queued tasks"""
+
+    def __init__(self, size, queue_depth, task_timeout, queue_timeout, worker_config):
+        self.size = size
+        self.task_timeout = task_timeout
+        self.queue_timeout = queue_timeout
+        self.executor = ProcessPoolExecutor(
+            max_workers=size,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(worker_config,)
+        )
+        # Running plus waiting tasks; callers block (back-pressure) when full
+        self.slots = threading.BoundedSemaphore(size + queue_depth)
+        # Set once the pool has been replaced and its workers killed
+        self.retired = False
+
+    def run(self, name, args, kwargs):
+        """Run a pdf_utils function in a worker process and wait for its result"""
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            raise PdfPoolBusy(f"PDF pool queue is full ({self.size} workers)")
+
+        try:
+            future = self.executor.submit(_run_in_worker, name, args, kwargs)
+        except Exception:
+            self.slots.release()
+            if self.retired:
+                # Replaced between get_pdf_pool() and submit
+                raise CancelledError()
+            raise
+
+        # The slot is freed when the task ends, or fails because its worker was killed
+        future.add_done_callback(lambda _: self.slots.release())
+        return future.result(timeout=self.task_timeout)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def terminate(self):
+        """Kill the workers, so a hung task cannot keep running and write its output later"""
+        self.retired = True
+        kill_workers = getattr(self.executor, 'kill_workers', None)
+        if kill_workers is not None:
+            kill_workers()
+            return
+        processes = list((self.executor._processes or {}).values())
+        self.shutdown()
+        for process in processes:
+            process.kill()
+
+def get_pdf_pool():
+    """Return the shared PDF pool, or None when PDF_POOL_SIZE is 0"""
+    global _pool
+
+    size = current_app.config.get('PDF_POOL_SIZE', 0)
+    if not size:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            worker_config = {key: value for key, value in current_app.config.items() if key.startswith('PDF_')}
+            worker_config['PDF_POOL_SIZE'] = 0
+            _pool = PdfProcessPool(
+                size,
+                current_app.config.get('PDF_POOL_QUEUE_DEPTH', 16),
+                current_app.config.get('PDF_POOL_TASK_TIMEOUT', 60),
+                current_app.config.get('PDF_POOL_QUEUE_TIMEOUT', 5),
+                worker_config
+            )
+        return _pool
+
+def reset_pdf_pool():
+    """Drop the shared PDF pool so the next call starts fresh workers"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = None
+
+def recycle_pdf_pool(pool):
+    """Replace a pool whose worker hung or died and kill its workers
+
+    Only the pool still in use is replaced, so callers reporting failures
+    from an already retired pool do not throw away its fresh successor.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.terminate()
+
+def pdf_pool_task(failure):
+    """Run the decorated pdf_utils function on the PDF pool when it is enabled
+
+    The call stays synchronous for the caller. When the pool is busy, the
+    task times out or a worker dies, ``failure`` is returned, matching what
+    the function itself returns on errors. A timeout or a dead worker
+    replaces the pool; tasks lost only because another task had the pool
+    replaced are run once more on the new workers.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(2):
+                pool = get_pdf_pool()
+                if pool is None:
+                    return func(*args, **kwargs)
+
+                try:
+                    return pool.run(func.__name__, args, kwargs)
+                except PdfPoolBusy as e:
+                    current_app.logger.warning(f"PDF pool busy, rejecting {func.__name__}: {str(e)}")
+                    return failure
+                except FutureTimeoutError:
+                    current_app.logger.error(f"PDF pool task {func.__name__} timed out, replacing workers")
+                    recycle_pdf_pool(pool)
+                    return failure
+                except (BrokenProcessPool, CancelledError) as e:
+                    if pool.retired and not attempt:
+                        continue
+                    current_app.logger.error(f"PDF pool worker died in {func.__name__}: {str(e)}")
+                    recycle_pdf_pool(pool)
+                    return failure
+                except Exception as e:
+                    # Raised by the task itself (or pickling its arguments); the workers are fine
+                    current_app.logger.error(f"PDF pool error in {func.__name__}: {str(e)}")
+                    return failure
+
+        return wrapper
+    return decorator
+
+def _init_worker(config):
+    """Give each worker process an app context so pdf_utils can log and read settings"""
+    app = Flask('pdf_worker')
+    app.config.update(config)
+    app.app_context().push()
+
+def _run_in_worker(name, args, kwargs):
+    from src.utils import pdf_utils
+    return getattr(pdf_utils, name).__wrapped__(*args, **kwargs)
@@ -3,127 +3,289 @@ import qrcode
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.units import inch
-from reportlab.lib.colors import black, gray
+from reportlab.lib.colors import black, gray, white
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, EncodedStreamObject,
+    FloatObject, IndirectObject, NameObject, NumberObject, StreamObject
+)
 from io import BytesIO
+import re
+from functools import lru_cache
 from flask import current_app
-import tempfile
+from src.utils.docx_converter import convert_docx_to_pdf
+from src.utils.pdf_pool import pdf_pool_task
 import uuid
 from datetime import datetime
 
-def generate_qr_code(data, size=100):
-    """Generate QR code and return file path"""
+try:
+    import pikepdf
+except ImportError:  # Linearization is optional; signed PDFs are kept as written
+    pikepdf = None
+
+QR_CODE_CACHE_SIZE = 256
+
+@lru_cache(maxsize=QR_CODE_CACHE_SIZE)
+def _qr_matrix(data):
+    """Build the QR code module matrix for data"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    
+    return tuple(tuple(row) for row in qr.get_matrix())
+
+def generate_qr_code(data):
+    """Generate QR code module matrix (cached by data, nothing is written to disk)"""
     try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(data)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Save to temporary file
-        temp_dir = tempfile.gettempdir()
-        qr_filename = f"qr_{uuid.uuid4().hex}.png"
-        qr_path = os.path.join(temp_dir, qr_filename)
-        
-        img.save(qr_path)
-        return qr_path
+        return _qr_matrix(data)
         
     except Exception as e:
         current_app.logger.error(f"Error generating QR code: {str(e)}")
         return None
 
-def create_signature_footer(signature_data, qr_code_path=None):
-    """Create a signature footer PDF overlay"""
+def draw_qr_code(c, qr_code, x, y, size):
+    """Draw a QR code module matrix as vector rectangles"""
+    module = size / len(qr_code)
+    
+    # Quiet zone and light modules
+    c.saveState()
+    c.setFillColor(white)
+    c.rect(x, y, size, size, fill=1, stroke=0)
+    c.setFillColor(black)
+    
+    # One rectangle per horizontal run of dark modules, filled as a single
+    # path so viewers do not show seams between adjacent rows
+    path = c.beginPath()
+    for row_index, row in enumerate(qr_code):
+        row_y = y + size - (row_index + 1) * module
+        run_start = None
+        for col_index, dark in enumerate(row + (False,)):
+            if dark and run_start is None:
+                run_start = col_index
+            elif not dark and run_start is not None:
+                path.rect(x + run_start * module, row_y, (col_index - run_start) * module, module)
+                run_start = None
+    c.drawPath(path, fill=1, stroke=0)
+    
+    c.restoreState()
+
+FOOTER_HEIGHT = 1.5 * inch
+
+def _page_geometry(page):
+    """Return a hashable (width, height) key for a page's mediabox"""
+    return (round(float(page.mediabox.width), 2), round(float(page.mediabox.height), 2))
+
+def _draw_footer_background(c, page_width):
+    """Draw the signer-independent part of the footer: background band and title"""
+    # Draw footer background
+    c.setFillColor(gray)
+    c.rect(0, 0, page_width, FOOTER_HEIGHT, fill=1, stroke=0)
+    
+    # Title
+    c.setFillColor(black)
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(0.5 * inch, FOOTER_HEIGHT - 0.3 * inch, "DOCUMENTO ASSINADO ELETRONICAMENTE")
+
+def _draw_signature_details(c, signature_data, page_width, qr_code=None):
+    """Draw the per-signer text and QR code onto a footer canvas"""
+    c.setFillColor(black)
+    
+    y_pos = FOOTER_HEIGHT - 0.5 * inch
+    c.setFont("Helvetica", 8)
+    
+    # Signature details
+    details = [
+        f"Assinado por: {signature_data.get('signer_email', 'N/A')}",
+        f"Data/Hora: {signature_data.get('signed_at', 'N/A')}",
+        f"IP: {signature_data.get('ip_address', 'N/A')}",
+        f"ID da Assinatura: {signature_data.get('signature_id', 'N/A')}"
+    ]
+    
+    for detail in details:
+        c.drawString(0.5 * inch, y_pos, detail)
+        y_pos -= 0.15 * inch
+    
+    # Add QR code if provided
+    if qr_code:
+        try:
+            qr_size = 0.8 * inch
+            qr_x = page_width - qr_size - 0.5 * inch
+            qr_y = 0.2 * inch
+            draw_qr_code(c, qr_code, qr_x, qr_y, qr_size)
+            
+            # Add QR code label
+            c.setFont("Helvetica", 6)
+            c.drawString(qr_x, qr_y - 0.15 * inch, "Verificar documento")
+            
+        except Exception as e:
+            current_app.logger.warning(f"Could not add QR code to footer: {str(e)}")
+
+# Not cached: a single canvas (~2 ms) beat merging an LRU-cached static layer (~6 ms per footer)
+def build_signature_footer(signature_data, qr_code=None, page_size=A4):
+    """Render a signature footer page for one page size on a single canvas"""
     try:
-        # Create a temporary PDF with signature footer
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=A4)
+        page_width, page_height = page_size
         
-        # Footer dimensions
-        footer_height = 1.5 * inch
-        page_width, page_height = A4
-        
-        # Draw footer background
-        c.setFillColor(gray)
-        c.rect(0, 0, page_width, footer_height, fill=1, stroke=0)
+        buffer = BytesIO()
+        c = canvas.Canvas(buffer, pagesize=(page_width, page_height))
+        _draw_footer_background(c, page_width)
+        _draw_signature_details(c, signature_data, page_width, qr_code)
+        c.save()
+        buffer.seek(0)
         
-        # Set text color
-        c.setFillColor(black)
+        return PdfReader(buffer).pages[0]
         
-        # Add signature information
-        y_pos = footer_height - 0.3 * inch
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(0.5 * inch, y_pos, "DOCUMENTO ASSINADO ELETRONICAMENTE")
+    except Exception as e:
+        current_app.logger.error(f"Error creating signature footer: {str(e)}")
+        return None
+
+def create_signature_footer(signature_data, qr_code=None, page_size=A4):
+    """Create a signature footer PDF overlay"""
+    try:
+        footer_page = build_signature_footer(signature_data, qr_code, page_size)
+        if footer_page is None:
+            return None
         
-        y_pos -= 0.2 * inch
-        c.setFont("Helvetica", 8)
+        writer = PdfWriter()
+        writer.add_page(footer_page)
         
-        # Signature details
-        details = [
-            f"Assinado por: {signature_data.get('signer_email', 'N/A')}",
-            f"Data/Hora: {signature_data.get('signed_at', 'N/A')}",
-            f"IP: {signature_data.get('ip_address', 'N/A')}",
-            f"ID da Assinatura: {signature_data.get('signature_id', 'N/A')}"
-        ]
+        buffer = BytesIO()
+        writer.write(buffer)
+        buffer.seek(0)
         
-        for detail in details:
-            c.drawString(0.5 * inch, y_pos, detail)
-            y_pos -= 0.15 * inch
-        
-        # Add QR code if provided
-        if qr_code_path and os.path.exists(qr_code_path):
-            try:
-                qr_size = 0.8 * inch
-                qr_x = page_width - qr_size - 0.5 * inch
-                qr_y = 0.2 * inch
-                c.drawImage(qr_code_path, qr_x, qr_y, qr_size, qr_size)
-                
-                # Add QR code label
-                c.setFont("Helvetica", 6)
-                c.drawString(qr_x, qr_y - 0.15 * inch, "Verificar documento")
-                
-            except Exception as e:
-                current_app.logger.warning(f"Could not add QR code to footer: {str(e)}")
+        return buffer
         
+    except Exception as e:
+        current_app.logger.error(f"Error creating signature footer: {str(e)}")
+        return None
+
+# Size in points of a field placed without width/height
+FIELD_DEFAULT_SIZES = {
+    'signature': (150, 40),
+    'date': (100, 20),
+    'full_name': (150, 20),
+    'checkbox': (12, 12),
+}
+
+def _fit_font_size(text, font_name, width, height, max_size=12):
+    """Largest font size (up to max_size) at which text fits in a width x height box"""
+    size = min(max_size, height * 0.7)
+    text_width = pdfmetrics.stringWidth(text, font_name, size)
+    if text_width > width:
+        size *= width / text_width
+    return max(size, 4)
+
+def _signed_date(signature_data):
+    signed_at = signature_data.get('signed_at')
+    try:
+        return datetime.fromisoformat(signed_at).strftime('%d/%m/%Y')
+    except (TypeError, ValueError):
+        return signed_at or ''
+
+def _draw_field(c, field, signature_data):
+    """Draw one placed field; coordinates are points from the bottom-left corner of the page"""
+    field_type = field['field_type']
+    default_width, default_height = FIELD_DEFAULT_SIZES.get(field_type, (150, 20))
+    x, y = field['x_coord'], field['y_coord']
+    width, height = field.get('width') or default_width, field.get('height') or default_height
+    signer = signature_data.get('signer_name') or signature_data.get('signer_email', '')
+    
+    c.setFillColor(black)
+    c.setStrokeColor(black)
+    
+    if field_type == 'checkbox':
+        c.setLineWidth(0.8)
+        c.rect(x, y, width, height, fill=0, stroke=1)
+        path = c.beginPath()
+        path.moveTo(x + width * 0.2, y + height * 0.5)
+        path.lineTo(x + width * 0.4, y + height * 0.25)
+        path.lineTo(x + width * 0.8, y + height * 0.8)
+        c.setLineWidth(max(width, height) * 0.12)
+        c.drawPath(path, fill=0, stroke=1)
+    
+    elif field_type == 'signature':
+        caption = f"Assinado eletronicamente em {_signed_date(signature_data)}"
+        caption_size = min(6, height * 0.2)
+        c.setFont("Helvetica", caption_size)
+        c.drawString(x, y, caption)
+        
+        line_y = y + caption_size * 1.4
+        c.setLineWidth(0.5)
+        c.line(x, line_y, x + width, line_y)
+        
+        font_size = _fit_font_size(signer, "Helvetica-Oblique", width, height - caption_size * 1.4, max_size=16)
+        c.setFont("Helvetica-Oblique", font_size)
+        c.drawString(x, line_y + font_size * 0.3, signer)
+    
+    else:
+        text = _signed_date(signature_data) if field_type == 'date' else signer
+        font_size = _fit_font_size(text, "Helvetica", width, height)
+        c.setFont("Helvetica", font_size)
+        c.drawString(x, y + (height - font_size) / 2 + font_size * 0.2, text)
+
+def build_field_overlay(fields, signature_data, page_size):
+    """Draw every field placed on one page into a single overlay page
+
+    ``fields`` are dicts with ``field_type``, ``x_coord``, ``y_coord`` and
+    optional ``width``/``height`` in points.
+    """
+    try:
+        page_width, page_height = page_size
+        buffer = BytesIO()
+        c = canvas.Canvas(buffer, pagesize=(page_width, page_height))
+        for field in fields:
+            _draw_field(c, field, signature_data)
         c.save()
         buffer.seek(0)
         
-        return buffer
+        return PdfReader(buffer).pages[0]
         
     except Exception as e:
-        current_app.logger.error(f"Error creating signature footer: {str(e)}")
+        current_app.logger.error(f"Error creating field overlay: {str(e)}")
+        return None
+
+def _field_overlays(fields, signature_data):
+    """Page overlays for the pages that have fields; other pages are not touched"""
+    if not fields:
         return None
+    return {
+        int(page_number): (lambda geometry, page_fields=page_fields: build_field_overlay(page_fields, signature_data, geometry))
+        for page_number, page_fields in fields.items() if page_fields
+    }
+
+@pdf_pool_task(failure=False)
+def add_signature_to_pdf(input_path, output_path, signature_data, qr_code=None, incremental=None, fields=None):
+    """Add signature footer, QR code and placed fields to PDF
 
-def add_signature_to_pdf(input_path, output_path, signature_data, qr_code_path=None):
-    """Add signature footer and QR code to PDF"""
+    ``fields`` maps page numbers to the field placements drawn on that page
+    (see ``build_field_overlay``). With ``incremental`` the original bytes
+    are kept untouched and the stamps are appended as a PDF incremental
+    update. When not given, the ``PDF_INCREMENTAL_SIGNING`` setting decides.
+    """
+    if incremental is None:
+        incremental = current_app.config.get('PDF_INCREMENTAL_SIGNING', False)
+    
+    if incremental:
+        return append_signature_update(input_path, output_path, signature_data, qr_code, fields)
+    
     try:
         # Read the original PDF
         with open(input_path, 'rb') as input_file:
             reader = PdfReader(input_file)
-            writer = PdfWriter()
             
-            # Create signature footer
-            footer_buffer = create_signature_footer(signature_data, qr_code_path)
-            if not footer_buffer:
-                return False
-            
-            footer_reader = PdfReader(footer_buffer)
-            footer_page = footer_reader.pages[0]
-            
-            # Add footer to each page
-            for page_num in range(len(reader.pages)):
-                page = reader.pages[page_num]
-                
-                # Merge footer with page
-                page.merge_page(footer_page)
-                writer.add_page(page)
+            # One footer Form XObject per distinct page geometry, shared by all pages
+            writer = _overlay_rewrite(
+                reader,
+                lambda geometry: build_signature_footer(signature_data, qr_code, geometry),
+                '/ZPSignature',
+                _field_overlays(fields, signature_data)
+            )
             
             # Write the output PDF
             with open(output_path, 'wb') as output_file:
@@ -135,19 +297,413 @@ def add_signature_to_pdf(input_path, output_path, signature_data, qr_code_path=N
         current_app.logger.error(f"Error adding signature to PDF: {str(e)}")
         return False
 
+class _IncrementalUpdate:
+    """Collects new and replaced objects and appends them as an incremental update"""
+    
+    def __init__(self, reader, original_size, startxref):
+        self.reader = reader
+        self.original_size = original_size
+        self.startxref = startxref
+        # Xref stream trailers are not always exposed by the reader, so the
+        # next free object number is derived from the known objects too
+        known = [number for numbers in reader.xref.values() for number in numbers]
+        known.extend(reader.xref_objStm)
+        self.next_number = max([int(reader.trailer.get('/Size', 0))] + [number + 1 for number in known])
+        self.objects = {}
+        self._imported = {}
+    
+    def add(self, obj):
+        """Register a new object and return a reference to it"""
+        reference = IndirectObject(self.next_number, 0, None)
+        self.next_number += 1
+        self.objects[(reference.idnum, 0)] = obj
+        return reference
+    
+    def replace(self, reference, obj):
+        """Register a new version of an object from the original file"""
+        self.objects[(reference.idnum, reference.generation)] = obj
+    
+    def import_object(self, obj):
+        """Copy an object graph from another document, renumbering its references"""
+        if isinstance(obj, IndirectObject):
+            key = (id(obj.pdf), obj.idnum, obj.generation)
+            if key not in self._imported:
+                reference = self.add(None)
+                self._imported[key] = reference
+                self.objects[(reference.idnum, 0)] = self.import_object(obj.get_object())
+            return self._imported[key]
+        
+        if isinstance(obj, StreamObject):
+            copy = EncodedStreamObject() if '/Filter' in obj else DecodedStreamObject()
+            copy._data = obj._data
+            for key, value in obj.items():
+                copy[NameObject(key)] = self.import_object(value)
+            return copy
+        
+        if isinstance(obj, DictionaryObject):
+            return DictionaryObject({NameObject(key): self.import_object(value) for key, value in obj.items()})
+        
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.import_object(value) for value in obj)
+        
+        return obj
+    
+    def write(self, output):
+        """Append the collected objects and a new cross-reference section"""
+        buffer = BytesIO()
+        offsets = {}
+        
+        for (number, generation), obj in sorted(self.objects.items()):
+            offsets[(number, generation)] = self.original_size + buffer.tell()
+            buffer.write(f"{number} {generation} obj\n".encode())
+            obj.write_to_stream(buffer, None)
+            buffer.write(b"\nendobj\n")
+        
+        trailer = DictionaryObject({
+            NameObject('/Root'): self.reader.trailer.raw_get('/Root'),
+            NameObject('/Prev'): NumberObject(self.startxref),
+        })
+        for key in ('/Info', '/ID'):
+            if key in self.reader.trailer:
+                trailer[NameObject(key)] = self.reader.trailer.raw_get(key)
+        
+        if self._uses_xref_stream():
+            self._write_xref_stream(buffer, offsets, trailer)
+        else:
+            self._write_xref_table(buffer, offsets, trailer)
+        
+        output.write(b"\n")
+        output.write(buffer.getvalue())
+    
+    def _uses_xref_stream(self):
+        self.reader.stream.seek(self.startxref)
+        return not self.reader.stream.read(4) == b"xref"
+    
+    def _write_xref_table(self, buffer, offsets, trailer):
+        xref_offset = self.original_size + buffer.tell()
+        buffer.write(b"xref\n")
+        for start, entries in _xref_subsections(offsets):
+            buffer.write(f"{start} {len(entries)}\n".encode())
+            for generation, offset in entries:
+                buffer.write(f"{offset:010d} {generation:05d} n\r\n".encode())
+        
+        trailer[NameObject('/Size')] = NumberObject(self.next_number)
+        buffer.write(b"trailer\n")
+        trailer.write_to_stream(buffer, None)
+        buffer.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+    
+    def _write_xref_stream(self, buffer, offsets, trailer):
+        xref_number = self.next_number
+        xref_offset = self.original_size + buffer.tell()
+        offsets[(xref_number, 0)] = xref_offset
+        
+        index = ArrayObject()
+        rows = BytesIO()
+        for start, entries in _xref_subsections(offsets):
+            index.extend([NumberObject(start), NumberObject(len(entries))])
+            for generation, offset in entries:
+                rows.write(b"\x01" + offset.to_bytes(4, 'big') + generation.to_bytes(2, 'big'))
+        
+        xref_stream = DecodedStreamObject()
+        xref_stream._data = rows.getvalue()
+        xref_stream.update(trailer)
+        xref_stream.update({
+            NameObject('/Type'): NameObject('/XRef'),
+            NameObject('/Size'): NumberObject(xref_number + 1),
+            NameObject('/Index'): index,
+            NameObject('/W'): ArrayObject([NumberObject(1), NumberObject(4), NumberObject(2)]),
+        })
+        
+        buffer.write(f"{xref_number} 0 obj\n".encode())
+        xref_stream.write_to_stream(buffer, None)
+        buffer.write(f"\nendobj\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+def _xref_subsections(offsets):
+    """Group (number, generation) -> offset entries into contiguous xref subsections"""
+    subsections = []
+    for (number, generation), offset in sorted(offsets.items()):
+        if subsections and subsections[-1][0] + len(subsections[-1][1]) == number:
+            subsections[-1][1].append((generation, offset))
+        else:
+            subsections.append((number, [(generation, offset)]))
+    return subsections
+
+def _find_startxref(pdf_tail):
+    """Return the offset of the last cross-reference section from the end of a PDF"""
+    matches = re.findall(rb"startxref\s+(\d+)", pdf_tail[-2048:])
+    if not matches:
+        raise ValueError("startxref not found")
+    return int(matches[-1])
+
+class _WriterObjects:
+    """Object registry of a PdfWriter with the same interface as _IncrementalUpdate"""
+    
+    def __init__(self, writer):
+        self.writer = writer
+    
+    def add(self, obj):
+        return self.writer._add_object(obj)
+    
+    def import_object(self, obj):
+        return obj.clone(self.writer)
+
+class _OverlayStamper:
+    """Draws one overlay per page geometry on many pages through a shared Form XObject
+
+    The overlay content and resources (fonts, QR images) are stored once
+    per geometry and every page only gains a small content stream with a
+    ``Do`` operator, instead of a full copy of the overlay.
+    """
+    
+    def __init__(self, objects, overlay_for_geometry, name_prefix):
+        self.objects = objects
+        self.overlay_for_geometry = overlay_for_geometry
+        # Earlier overlays keep their own XObject, so each stamp uses a fresh name
+        self.overlay_name = f"{name_prefix}{uuid.uuid4().hex[:8]}"
+        self.forms = {}
+        self.draws = {}
+        
+        # Graphics state is saved before the original content and restored
+        # before drawing the overlay, so page content cannot leak into it
+        save_state = DecodedStreamObject()
+        save_state._data = b"q\n"
+        self.save_state = objects.add(save_state)
+    
+    def _build_form(self, overlay_page, geometry):
+        form = DecodedStreamObject()
+        form._data = overlay_page.get_contents().get_data()
+        form = form.flate_encode()
+        form.update({
+            NameObject('/Type'): NameObject('/XObject'),
+            NameObject('/Subtype'): NameObject('/Form'),
+            NameObject('/BBox'): ArrayObject([FloatObject(0), FloatObject(0), FloatObject(geometry[0]), FloatObject(geometry[1])]),
+            NameObject('/Resources'): self.objects.import_object(overlay_page['/Resources']),
+        })
+        return self.objects.add(form)
+    
+    def _form(self, geometry):
+        if geometry not in self.forms:
+            overlay_page = self.overlay_for_geometry(geometry)
+            if overlay_page is None:
+                raise ValueError(f"Could not build overlay for page size {geometry}")
+            self.forms[geometry] = self._build_form(overlay_page, geometry)
+        return self.forms[geometry]
+    
+    def _draw(self, origin):
+        if origin not in self.draws:
+            draw = DecodedStreamObject()
+            draw._data = f"Q\nq 1 0 0 1 {origin[0]:g} {origin[1]:g} cm {self.overlay_name} Do Q\n".encode()
+            self.draws[origin] = self.objects.add(draw)
+        return self.draws[origin]
+    
+    def stamp(self, page_dict, geometry, origin, overlay_page=None):
+        """Add the overlay to a page dictionary, modifying it in place
+
+        ``overlay_page`` draws an overlay that belongs to this page only
+        instead of the one shared by its geometry.
+        """
+        form_ref = self._form(geometry) if overlay_page is None else self._build_form(overlay_page, geometry)
+        
+        contents = page_dict.raw_get('/Contents') if '/Contents' in page_dict else None
+        if contents is None:
+            original_contents = []
+        elif isinstance(contents, IndirectObject) and isinstance(contents.get_object(), ArrayObject):
+            original_contents = list(contents.get_object())
+        elif isinstance(contents, ArrayObject):
+            original_contents = list(contents)
+        else:
+            original_contents = [contents]
+        page_dict[NameObject('/Contents')] = ArrayObject([self.save_state] + original_contents + [self._draw(origin)])
+        
+        resources = DictionaryObject(page_dict['/Resources']) if '/Resources' in page_dict else DictionaryObject()
+        xobjects = DictionaryObject(resources['/XObject']) if '/XObject' in resources else DictionaryObject()
+        xobjects[NameObject(self.overlay_name)] = form_ref
+        resources[NameObject('/XObject')] = xobjects
+        page_dict[NameObject('/Resources')] = resources
+
+def _page_origin(page):
+    return (float(page.mediabox.left), float(page.mediabox.bottom))
+
+def _stamp_page_overlays(objects, page_overlays):
+    """Return a function drawing the page-specific overlay of a page number, if it has one
+
+    ``page_overlays`` maps page numbers to a function returning the overlay
+    page for a geometry; pages without an entry are left alone.
+    """
+    if not page_overlays:
+        return lambda page_dict, page_number, geometry, origin: None
+    
+    stamper = _OverlayStamper(objects, None, '/ZPPage')
+    
+    def stamp(page_dict, page_number, geometry, origin):
+        overlay_for_geometry = page_overlays.get(page_number)
+        if overlay_for_geometry is None:
+            return
+        overlay_page = overlay_for_geometry(geometry)
+        if overlay_page is None:
+            raise ValueError(f"Could not build overlay for page {page_number}")
+        stamper.stamp(page_dict, geometry, origin, overlay_page)
+    
+    return stamp
+
+def _overlay_update(reader, original_size, startxref, overlay_for_geometry, name_prefix, page_overlays=None):
+    """Build an incremental update that draws an overlay on every page
+
+    ``overlay_for_geometry`` returns the overlay page for a (width, height)
+    geometry; ``page_overlays`` adds page-specific overlays (see
+    ``_stamp_page_overlays``). Returns the bytes to append after the original
+    ``original_size`` bytes.
+    """
+    update = _IncrementalUpdate(reader, original_size + 1, startxref)
+    stamper = _OverlayStamper(update, overlay_for_geometry, name_prefix)
+    stamp_page_overlay = _stamp_page_overlays(update, page_overlays)
+    
+    for page_number, page in enumerate(reader.pages, start=1):
+        new_page = DictionaryObject(page)
+        geometry, origin = _page_geometry(page), _page_origin(page)
+        stamper.stamp(new_page, geometry, origin)
+        stamp_page_overlay(new_page, page_number, geometry, origin)
+        update.replace(page.indirect_reference, new_page)
+    
+    buffer = BytesIO()
+    update.write(buffer)
+    return buffer.getvalue()
+
+def _overlay_rewrite(reader, overlay_for_geometry, name_prefix, page_overlays=None):
+    """Copy all pages into a new PdfWriter with an overlay drawn on each"""
+    writer = PdfWriter()
+    objects = _WriterObjects(writer)
+    stamper = _OverlayStamper(objects, overlay_for_geometry, name_prefix)
+    stamp_page_overlay = _stamp_page_overlays(objects, page_overlays)
+    
+    for page_number, page in enumerate(reader.pages, start=1):
+        geometry, origin = _page_geometry(page), _page_origin(page)
+        new_page = writer.add_page(page)
+        stamper.stamp(new_page, geometry, origin)
+        stamp_page_overlay(new_page, page_number, geometry, origin)
+    
+    return writer
+
+def append_signature_update(input_path, output_path, signature_data, qr_code=None, fields=None):
+    """Stamp the signature footer as an incremental update appended to the original PDF
+
+    The original bytes are copied unchanged and followed by the footer Form
+    XObject, new versions of the page dictionaries and a new xref section, so
+    signing cost depends on the footer and page count, not on document size.
+    """
+    try:
+        with open(input_path, 'rb') as input_file:
+            original = input_file.read()
+        
+        reader = PdfReader(BytesIO(original))
+        if reader.is_encrypted:
+            current_app.logger.warning("Incremental signing not supported for encrypted PDFs, rewriting document")
+            return add_signature_to_pdf(input_path, output_path, signature_data, qr_code, incremental=False, fields=fields)
+        
+        update = _overlay_update(
+            reader, len(original), _find_startxref(original),
+            lambda geometry: build_signature_footer(signature_data, qr_code, geometry),
+            '/ZPSignature',
+            _field_overlays(fields, signature_data)
+        )
+        
+        if os.path.abspath(input_path) == os.path.abspath(output_path):
+            with open(output_path, 'ab') as output_file:
+                output_file.write(update)
+        else:
+            with open(output_path, 'wb') as output_file:
+                output_file.write(original)
+                output_file.write(update)
+        
+        return True
+        
+    except Exception as e:
+        current_app.logger.error(f"Error appending signature update to PDF: {str(e)}")
+        return False
+
+def linearization_available():
+    """Check if PDFs can be linearized in this deployment"""
+    return pikepdf is not None
+
+@pdf_pool_task(failure=False)
+def linearize_pdf(pdf_path):
+    """Rewrite a PDF in place as linearized ("fast web view")
+
+    Page 1 and its resources are moved to the start of the file with a hint
+    table, so viewers fetching byte ranges can render it before the rest of
+    the file arrives. The rewrite drops incremental updates.
+    """
+    if not linearization_available():
+        return False
+    
+    temp_path = f"{pdf_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with pikepdf.open(pdf_path) as pdf:
+            pdf.save(temp_path, linearize=True)
+        os.replace(temp_path, pdf_path)
+        return True
+        
+    except Exception as e:
+        current_app.logger.error(f"Error linearizing PDF: {str(e)}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+
+def iter_pdf_page_text(pdf_path):
+    """Yield (page_number, text) for each page, one page at a time"""
+    with open(pdf_path, 'rb') as file:
+        reader = PdfReader(file)
+        for page_number, page in enumerate(reader.pages, start=1):
+            yield page_number, page.extract_text() or ""
+
 def extract_pdf_text(pdf_path):
     """Extract text from PDF for indexing/searching"""
     try:
-        text = ""
-        with open(pdf_path, 'rb') as file:
-            reader = PdfReader(file)
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        return text
+        return "\n".join(text for _, text in iter_pdf_page_text(pdf_path))
     except Exception as e:
         current_app.logger.error(f"Error extracting PDF text: {str(e)}")
         return ""
 
+def extract_pdf_geometry(pdf_path):
+    """Extract page count, per-page mediabox and rotation, encryption flag and PDF version in one parse"""
+    try:
+        with open(pdf_path, 'rb') as file:
+            reader = PdfReader(file)
+            
+            header = reader.pdf_header
+            geometry = {
+                'pdf_version': header[5:] if header.startswith('%PDF-') else None,
+                'is_encrypted': reader.is_encrypted,
+                'page_count': None,
+                'pages': None
+            }
+            
+            # Encrypted documents only expose pages if they open with an empty password
+            if reader.is_encrypted:
+                try:
+                    if not reader.decrypt(''):
+                        return geometry
+                except Exception:
+                    return geometry
+            
+            geometry['pages'] = [
+                [
+                    round(float(page.mediabox.left), 2),
+                    round(float(page.mediabox.bottom), 2),
+                    round(float(page.mediabox.right), 2),
+                    round(float(page.mediabox.top), 2),
+                    int(page.get('/Rotate', 0) or 0) % 360
+                ]
+                for page in reader.pages
+            ]
+            geometry['page_count'] = len(geometry['pages'])
+            
+            return geometry
+            
+    except Exception as e:
+        current_app.logger.error(f"Error extracting PDF geometry: {str(e)}")
+        return None
+
 def get_pdf_page_count(pdf_path):
     """Get number of pages in PDF"""
     try:
@@ -172,59 +728,50 @@ def validate_pdf_file(pdf_path):
         return False
 
 def convert_docx_to_pdf_advanced(docx_path, pdf_path):
-    """Advanced DOCX to PDF conversion (placeholder for future implementation)"""
-    try:
-        # This is a placeholder for advanced DOCX to PDF conversion
-        # In production, you could use:
-        # 1. python-docx + reportlab for basic conversion
-        # 2. LibreOffice headless mode
-        # 3. External service like Pandoc
-        # 4. Commercial API like Aspose or GroupDocs
-        
-        current_app.logger.warning("Advanced DOCX to PDF conversion not implemented")
-        
-        # For now, just copy the file (this is NOT a real conversion)
-        import shutil
-        shutil.copy2(docx_path, pdf_path)
-        
-        return True
-        
-    except Exception as e:
-        current_app.logger.error(f"DOCX to PDF conversion error: {str(e)}")
-        return False
+    """Convert DOCX to PDF with the pooled headless LibreOffice workers"""
+    return convert_docx_to_pdf(docx_path, pdf_path)
+
+WATERMARK_LAYER_CACHE_SIZE = 32
+DRAFT_STREAM_CHUNK_SIZE = 1024 * 1024  # 1MB
 
+@lru_cache(maxsize=WATERMARK_LAYER_CACHE_SIZE)
+def _watermark_layer(watermark_text, page_width, page_height):
+    """Render the watermark for a page geometry, cached by text and size.
+
+    The returned page is shared between calls and must only be used as the
+    source of a merge, never modified in place.
+    """
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=(page_width, page_height))
+    
+    # Set watermark properties
+    c.setFillColor(gray)
+    c.setFont("Helvetica-Bold", 50)
+    
+    # Rotate and position watermark
+    c.saveState()
+    c.translate(page_width / 2, page_height / 2)
+    c.rotate(45)
+    c.drawCentredString(0, 0, watermark_text)
+    c.restoreState()
+    
+    c.save()
+    buffer.seek(0)
+    
+    return PdfReader(buffer).pages[0]
+
+@pdf_pool_task(failure=False)
 def add_watermark_to_pdf(input_path, output_path, watermark_text="DRAFT"):
     """Add watermark to PDF (useful for draft documents)"""
     try:
-        # Create watermark
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=A4)
-        
-        # Set watermark properties
-        c.setFillColor(gray)
-        c.setFont("Helvetica-Bold", 50)
-        
-        # Rotate and position watermark
-        c.saveState()
-        c.translate(A4[0]/2, A4[1]/2)
-        c.rotate(45)
-        c.drawCentredText(0, 0, watermark_text)
-        c.restoreState()
-        
-        c.save()
-        buffer.seek(0)
-        
         # Apply watermark to PDF
         with open(input_path, 'rb') as input_file:
             reader = PdfReader(input_file)
-            writer = PdfWriter()
-            
-            watermark_reader = PdfReader(buffer)
-            watermark_page = watermark_reader.pages[0]
-            
-            for page in reader.pages:
-                page.merge_page(watermark_page)
-                writer.add_page(page)
+            writer = _overlay_rewrite(
+                reader,
+                lambda geometry: _watermark_layer(watermark_text, *geometry),
+                '/ZPWatermark'
+            )
             
             with open(output_path, 'wb') as output_file:
                 writer.write(output_file)
@@ -235,6 +782,59 @@ def add_watermark_to_pdf(input_path, output_path, watermark_text="DRAFT"):
         current_app.logger.error(f"Error adding watermark to PDF: {str(e)}")
         return False
 
+def draft_pdf_stream(input_path, watermark_text="DRAFT", chunk_size=DRAFT_STREAM_CHUNK_SIZE):
+    """Stream a watermarked view of a PDF without writing a copy to disk
+
+    The original bytes are streamed as they are, followed by an incremental
+    update that draws the cached watermark layer on every page. Only the
+    page dictionaries are parsed up front, so memory use does not grow with
+    the document size. Returns ``(content_length, chunks)`` or ``None``.
+    """
+    try:
+        original_size = os.path.getsize(input_path)
+        
+        with open(input_path, 'rb') as input_file:
+            reader = PdfReader(input_file)
+            
+            if reader.is_encrypted:
+                # Encrypted files cannot be updated in place, watermark a rewrite in memory
+                writer = _overlay_rewrite(
+                    reader,
+                    lambda geometry: _watermark_layer(watermark_text, *geometry),
+                    '/ZPWatermark'
+                )
+                buffer = BytesIO()
+                writer.write(buffer)
+                content = buffer.getvalue()
+                return len(content), iter([content])
+            
+            input_file.seek(max(0, original_size - 2048))
+            startxref = _find_startxref(input_file.read())
+            
+            update = _overlay_update(
+                reader, original_size, startxref,
+                lambda geometry: _watermark_layer(watermark_text, *geometry),
+                '/ZPWatermark'
+            )
+        
+        def generate():
+            with open(input_path, 'rb') as input_file:
+                remaining = original_size
+                while remaining > 0:
+                    chunk = input_file.read(min(chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+            yield update
+        
+        return original_size + len(update), generate()
+        
+    except Exception as e:
+        current_app.logger.error(f"Error building draft PDF stream: {str(e)}")
+        return None
+
+@pdf_pool_task(failure=None)
 def create_signature_certificate(signature_data):
     """Create a signature certificate PDF"""
     try:
@@ -243,7 +843,7 @@ def create_signature_certificate(signature_data):
         
         # Title
         c.setFont("Helvetica-Bold", 16)
-        c.drawCentredText(A4[0]/2, A4[1] - 2*inch, "CERTIFICADO DE ASSINATURA ELETRÔNICA")
+        c.drawCentredString(A4[0]/2, A4[1] - 2*inch, "CERTIFICADO DE ASSINATURA ELETRÔNICA")
         
         # Content
         y_pos = A4[1] - 3*inch
@@ -265,7 +865,7 @@ def create_signature_certificate(signature_data):
         
         # Footer
         c.setFont("Helvetica", 8)
-        c.drawCentredText(A4[0]/2, inch, f"Certificado gerado em {datetime.utcnow().isoformat()}")
+        c.drawCentredString(A4[0]/2, inch, f"Certificado gerado em {datetime.utcnow().isoformat()}")
         
         c.save()
         buffer.seek(0)
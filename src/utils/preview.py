@@ -0,0 +1,70 @@
+import os
+import shutil
+import uuid
+from flask import current_app
+
+try:
+    import pypdfium2
+except ImportError:  # Previews are optional; routes fall back to the full PDF
+    pypdfium2 = None
+
+# Target width in pixels for each preview size
+PREVIEW_SIZES = {
+    'thumbnail': 200,
+    'page': 800,
+}
+
+def previews_available():
+    """Check if page previews can be rendered in this deployment"""
+    return pypdfium2 is not None
+
+def get_preview_folder():
+    """Directory holding rendered previews, grouped by document hash"""
+    return current_app.config.get('PREVIEW_FOLDER') or os.path.join(
+        current_app.config.get('UPLOAD_FOLDER', 'uploads'), 'previews'
+    )
+
+def preview_path(document_hash, page_number, size):
+    """Cache location of a page preview"""
+    return os.path.join(get_preview_folder(), document_hash[:2], document_hash, f"{size}-{page_number}.png")
+
+def render_page_preview(pdf_path, document_hash, page_number, size='thumbnail'):
+    """Return the path of a cached page preview, rendering it on first access"""
+    if not previews_available() or size not in PREVIEW_SIZES or not document_hash:
+        return None
+
+    cached_path = preview_path(document_hash, page_number, size)
+    if os.path.exists(cached_path):
+        return cached_path
+
+    pdf = None
+    try:
+        pdf = pypdfium2.PdfDocument(pdf_path)
+        if not 1 <= page_number <= len(pdf):
+            return None
+
+        page = pdf[page_number - 1]
+        scale = PREVIEW_SIZES[size] / page.get_width()
+        image = page.render(scale=scale).to_pil()
+
+        # Write to a temporary name first so concurrent requests never see partial files
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        temp_path = f"{cached_path}.{uuid.uuid4().hex}.tmp"
+        image.save(temp_path, format='PNG', optimize=True)
+        os.replace(temp_path, cached_path)
+
+        return cached_path
+
+    except Exception as e:
+        current_app.logger.error(f"Error rendering page preview: {str(e)}")
+        return None
+
+    finally:
+        if pdf is not None:
+            pdf.close()
+
+def remove_previews(document_hash):
+    """Delete all cached previews of a document hash"""
+    if not document_hash:
+        return
+    shutil.rmtree(os.path.dirname(preview_path(document_hash, 1, 'thumbnail')), ignore_errors=True)
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from src.models.user import AuditLog, Document, Settings, db
+from src.utils.blob_store import blob_hash
+from src.utils.hashing import find_corrupt_chunks, remember_file_hash
+from src.utils.storage import get_storage
+
+# Documents fetched per query while walking the table
+SCRUB_BATCH_SIZE = 100
+
+# Bytes read at a time; small enough for the rate limit to pace reads smoothly
+SCRUB_READ_SIZE = 1024 * 1024  # 1MB
+
+CHECKPOINT_KEY = 'integrity_scrub_checkpoint'
+
+# Seconds a run's lease lasts past its time limit, covering the file being read at the deadline
+SCRUB_LEASE_GRACE = 300
+
+class _IoThrottle:
+    """Sleep as needed to keep reads under a byte rate averaged over the run"""
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self.started = time.monotonic()
+        self.consumed = 0
+
+    def consume(self, size):
+        self.consumed += size
+        if self.bytes_per_second:
+            delay = self.started + self.consumed / self.bytes_per_second - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+def _parse_checkpoint(setting):
+    checkpoint = {
+        'last_document_id': 0, 'passes': 0, 'pass_started_at': None, 'last_pass_completed_at': None,
+        'lease_owner': None, 'lease_until': None
+    }
+    if setting and setting.setting_value:
+        checkpoint.update(json.loads(setting.setting_value))
+    return checkpoint
+
+def load_checkpoint():
+    """Return the scrubber progress: the last document id checked, pass counters and the run lease"""
+    return _parse_checkpoint(Settings.query.filter_by(setting_key=CHECKPOINT_KEY).first())
+
+def acquire_checkpoint(lease_seconds):
+    """Lease the scrubber to this run; returns the checkpoint, or None while another run holds it
+
+    The checkpoint row is locked while the lease is checked and taken, so a
+    run overlapping a slow previous one cannot start. The lease of a run
+    that died lapses after ``lease_seconds``.
+    """
+    setting = Settings.query.filter_by(setting_key=CHECKPOINT_KEY).with_for_update().first()
+    checkpoint = _parse_checkpoint(setting)
+    if checkpoint['lease_until'] and datetime.fromisoformat(checkpoint['lease_until']) > datetime.utcnow():
+        db.session.rollback()
+        return None
+
+    if setting is None:
+        setting = Settings(setting_key=CHECKPOINT_KEY)
+        db.session.add(setting)
+    checkpoint['lease_owner'] = uuid.uuid4().hex
+    checkpoint['lease_until'] = (datetime.utcnow() + timedelta(seconds=lease_seconds)).isoformat()
+    setting.setting_value = json.dumps(checkpoint)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another run created the row first
+        db.session.rollback()
+        return None
+    return checkpoint
+
+def save_checkpoint(checkpoint):
+    """Store the scrubber progress and commit, so a restarted worker resumes from it
+
+    Returns False, without saving, when the lease has passed to another run.
+    """
+    setting = Settings.query.filter_by(setting_key=CHECKPOINT_KEY).with_for_update().first()
+    if setting is None or _parse_checkpoint(setting)['lease_owner'] != checkpoint['lease_owner']:
+        db.session.rollback()
+        return False
+    setting.setting_value = json.dumps(checkpoint)
+    db.session.commit()
+    return True
+
+def _throttled_sha256(storage, key, throttle):
+    hash_sha256 = hashlib.sha256()
+    with storage.open(key) as stream:
+        for chunk in iter(lambda: stream.read(SCRUB_READ_SIZE), b''):
+            hash_sha256.update(chunk)
+            throttle.consume(len(chunk))
+    return hash_sha256.hexdigest()
+
+def _document_files(document):
+    """Yield (path, expected hash or None, is current file) for each file of a document"""
+    current_path = document.signed_path or document.original_path
+    for path in dict.fromkeys([document.original_path, document.signed_path]):
+        if not path:
+            continue
+        # Stored blobs are keyed by their hash; otherwise only the current file has a known hash
+        expected = blob_hash(path) or (document.sha256_hash if path == current_path else None)
+        yield path, expected, path == current_path
+
+def _record(action_type, document_id, details):
+    db.session.add(AuditLog(action_type=action_type, document_id=document_id, details=details))
+
+def scrub_file(document, path, expected, is_current, throttle):
+    """Re-read one stored file and record a missing file or hash mismatch; returns the outcome"""
+    storage = get_storage()
+    if not storage.exists(path):
+        _record('integrity_scrub_missing_file', document.id, f'Stored file not found: {path}')
+        return 'missing'
+    if expected is None:
+        return 'unverifiable'
+
+    current_hash = _throttled_sha256(storage, path, throttle)
+    # The file was read in full, so quick checks can rely on this digest
+    remember_file_hash(path, current_hash)
+    if current_hash == expected:
+        return 'valid'
+
+    details = f'{path}: expected {expected}, found {current_hash}'
+    if is_current and document.merkle_leaves:
+        corrupt = find_corrupt_chunks(path, document.merkle_leaves, document.merkle_chunk_size)
+        if corrupt:
+            details += f'; corrupt {document.merkle_chunk_size}-byte chunks {corrupt}'
+    current_app.logger.error(f"Integrity scrub of document {document.id} failed: {details}")
+    _record('integrity_scrub_mismatch', document.id, details)
+    return 'corrupt'
+
+def scrub_documents(time_limit=None, max_bytes_per_second=None):
+    """Verify stored document files in id order, resuming from the saved checkpoint
+
+    Runs until ``time_limit`` seconds have passed (SCRUB_TIME_LIMIT) while
+    reading at most ``max_bytes_per_second`` (SCRUB_MAX_BYTES_PER_SECOND,
+    0 for no limit). Progress is committed after every document. When the
+    last document has been checked the next run starts a new pass. Returns
+    counts of the files checked in this run, or ``{'skipped': True}`` while
+    another run holds the checkpoint lease.
+    """
+    if time_limit is None:
+        time_limit = current_app.config.get('SCRUB_TIME_LIMIT', 600)
+    if max_bytes_per_second is None:
+        max_bytes_per_second = current_app.config.get('SCRUB_MAX_BYTES_PER_SECOND', 0)
+
+    lease_seconds = time_limit + SCRUB_LEASE_GRACE
+    checkpoint = acquire_checkpoint(lease_seconds)
+    if checkpoint is None:
+        current_app.logger.info("Integrity scrub skipped, another run is in progress")
+        return {'skipped': True}
+
+    deadline = time.monotonic() + time_limit
+    throttle = _IoThrottle(max_bytes_per_second)
+    stats = {'documents': 0, 'valid': 0, 'corrupt': 0, 'missing': 0, 'unverifiable': 0, 'pass_completed': False}
+    # Blobs shared by several documents are read once per run
+    seen = set()
+    leased = True
+
+    if checkpoint['pass_started_at'] is None:
+        checkpoint['pass_started_at'] = datetime.utcnow().isoformat()
+
+    try:
+        while leased and time.monotonic() < deadline:
+            documents = db.session.query(
+                Document.id, Document.sha256_hash, Document.original_path, Document.signed_path,
+                Document.merkle_chunk_size, Document.merkle_leaves
+            ).filter(Document.id > checkpoint['last_document_id']).order_by(Document.id).limit(SCRUB_BATCH_SIZE).all()
+
+            if not documents:
+                checkpoint.update(
+                    last_document_id=0,
+                    passes=checkpoint['passes'] + 1,
+                    pass_started_at=None,
+                    last_pass_completed_at=datetime.utcnow().isoformat()
+                )
+                stats['pass_completed'] = True
+                break
+
+            for document in documents:
+                if time.monotonic() >= deadline:
+                    break
+                for path, expected, is_current in _document_files(document):
+                    if path in seen:
+                        continue
+                    seen.add(path)
+                    try:
+                        stats[scrub_file(document, path, expected, is_current, throttle)] += 1
+                        db.session.commit()
+                    except Exception as e:
+                        db.session.rollback()
+                        current_app.logger.error(f"Integrity scrub could not read {path}: {str(e)}")
+                stats['documents'] += 1
+                checkpoint['last_document_id'] = document.id
+                # Renewed with every document, so only a stalled run loses it
+                checkpoint['lease_until'] = (datetime.utcnow() + timedelta(seconds=lease_seconds)).isoformat()
+                leased = save_checkpoint(checkpoint)
+                if not leased:
+                    current_app.logger.warning("Integrity scrub lease was taken over, stopping this run")
+                    break
+
+    finally:
+        # Release the lease for the next scheduled run
+        if leased:
+            checkpoint['lease_until'] = None
+            save_checkpoint(checkpoint)
+
+    stats['last_document_id'] = checkpoint['last_document_id']
+    stats['bytes_read'] = throttle.consumed
+    return stats
@@ -0,0 +1,249 @@
+import re
+import unicodedata
+from collections import Counter
+from flask import current_app
+from sqlalchemy import column, func, literal_column, table
+from src.models.user import DocumentPage, DocumentTerm, db, page_search_vector
+from src.utils.pdf_utils import iter_pdf_page_text
+
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 10
+
+# Words too common to narrow a search; they are neither indexed nor matched
+STOPWORDS = frozenset((
+    # Portuguese
+    'de', 'da', 'do', 'das', 'dos', 'em', 'na', 'no', 'nas', 'nos', 'um', 'uma', 'uns', 'umas',
+    'os', 'as', 'ao', 'aos', 'por', 'para', 'pela', 'pelo', 'pelas', 'pelos', 'com', 'sem',
+    'que', 'se', 'ou', 'mas', 'como', 'mais', 'sua', 'seu', 'suas', 'seus', 'ser', 'sao',
+    'esta', 'este', 'isso', 'isto', 'ja', 'nao', 'foi', 'tem',
+    # English
+    'the', 'and', 'of', 'to', 'in', 'on', 'at', 'by', 'for', 'with', 'an', 'is', 'are', 'be',
+    'it', 'or', 'this', 'that', 'as', 'from', 'was', 'not',
+))
+
+_word_re = re.compile(r'\w+', re.UNICODE)
+_phrase_re = re.compile(r'"([^"]*)"')
+
+# SQLite's external-content FTS5 table over document_pages (see DocumentPage)
+_pages_fts = table('document_pages_fts', column('rowid'), column('rank'))
+
+def tokenize(text):
+    """Split text into lowercase, accent-free terms, without stopwords"""
+    normalized = unicodedata.normalize('NFKD', text.lower())
+    normalized = ''.join(char for char in normalized if not unicodedata.combining(char))
+    return [
+        word for word in _word_re.findall(normalized)
+        if MIN_TERM_LENGTH <= len(word) <= MAX_TERM_LENGTH and word not in STOPWORDS
+    ]
+
+def search_backend():
+    """Full-text backend of the configured database: 'postgresql', 'sqlite' or 'terms'
+
+    PostgreSQL and SQLite search DocumentPage through their own full-text
+    indexes; other databases fall back to the DocumentTerm postings.
+    """
+    dialect = db.engine.dialect.name
+    return dialect if dialect in ('postgresql', 'sqlite') else 'terms'
+
+def parse_search(search):
+    """Split a search into [(terms, prefix)] clauses that must all match one page
+
+    Quoted text is a phrase, a trailing ``*`` makes the last term a prefix
+    and every other word is a clause of its own.
+    """
+    clauses = []
+    for phrase in _phrase_re.findall(search):
+        terms = tokenize(phrase)
+        if terms:
+            clauses.append((terms, False))
+    
+    for word in _phrase_re.sub(' ', search).split():
+        terms = tokenize(word)
+        if terms:
+            clauses.append((terms, word.endswith('*')))
+    
+    return list(dict.fromkeys((tuple(terms), prefix) for terms, prefix in clauses))[:MAX_QUERY_TERMS]
+
+def _tsquery_text(clauses):
+    """to_tsquery syntax of parsed clauses: phrases joined by <->, prefixes marked :*"""
+    return ' & '.join(
+        ' <-> '.join(terms) + (':*' if prefix else '')
+        for terms, prefix in clauses
+    )
+
+def _fts5_text(clauses, user_id):
+    """FTS5 MATCH syntax of parsed clauses within the user's pages; terms are \\w only, so quoting them is safe"""
+    return 'user_id:"%d" AND content:(%s)' % (int(user_id), ' AND '.join(
+        '"' + ' '.join(terms) + '"' + (' *' if prefix else '')
+        for terms, prefix in clauses
+    ))
+
+def index_document(document_id, user_id, pdf_path, commit=True):
+    """Store the searchable text of a document, one page at a time
+
+    With ``commit=False`` the entries join the current transaction, and a
+    failure only discards the index, not the caller's pending changes.
+    """
+    try:
+        use_postings = search_backend() == 'terms'
+        
+        with db.session.begin_nested():
+            remove_document_index(document_id)
+            
+            for page_number, text in iter_pdf_page_text(pdf_path):
+                terms = tokenize(text)
+                if not terms:
+                    continue
+                
+                if not use_postings:
+                    db.session.bulk_insert_mappings(DocumentPage, [{
+                        'user_id': user_id,
+                        'document_id': document_id,
+                        'page_number': page_number,
+                        'content': ' '.join(terms)
+                    }])
+                    continue
+                
+                db.session.bulk_insert_mappings(DocumentTerm, [
+                    {
+                        'user_id': user_id,
+                        'term': term,
+                        'document_id': document_id,
+                        'page_number': page_number,
+                        'occurrences': occurrences
+                    }
+                    for term, occurrences in Counter(terms).items()
+                ])
+        
+        if commit:
+            db.session.commit()
+        return True
+        
+    except Exception as e:
+        if commit:
+            db.session.rollback()
+        current_app.logger.error(f"Error indexing document {document_id}: {str(e)}")
+        return False
+
+def remove_document_index(document_id):
+    """Delete the searchable text of a document (without committing)"""
+    DocumentPage.query.filter_by(document_id=document_id).delete()
+    DocumentTerm.query.filter_by(document_id=document_id).delete()
+
+def _matching_pages(clauses, user_id):
+    """Subquery of (document_id, page_number, rank) for the user's pages matching every clause"""
+    backend = search_backend()
+    
+    if backend == 'postgresql':
+        # Served by the GIN index on the page tsvector
+        vector = page_search_vector(DocumentPage.content)
+        tsquery = func.to_tsquery(literal_column("'simple'::regconfig"), _tsquery_text(clauses))
+        return db.session.query(
+            DocumentPage.document_id.label('document_id'),
+            DocumentPage.page_number.label('page_number'),
+            func.ts_rank_cd(vector, tsquery).label('rank')
+        ).filter(
+            DocumentPage.user_id == user_id,
+            vector.op('@@')(tsquery)
+        ).subquery()
+    
+    # SQLite FTS5, scoped to the owner inside the MATCH: a user_id filter on
+    # document_pages would make SQLite rerun the MATCH for each of the user's pages.
+    # Its hidden rank column is bm25(), lower for better matches.
+    return db.session.query(
+        DocumentPage.document_id.label('document_id'),
+        DocumentPage.page_number.label('page_number'),
+        (-_pages_fts.c.rank).label('rank')
+    ).select_from(_pages_fts).join(
+        DocumentPage, DocumentPage.id == _pages_fts.c.rowid
+    ).filter(
+        literal_column('document_pages_fts').op('MATCH')(_fts5_text(clauses, user_id))
+    ).subquery()
+
+def _matching_postings(clauses, user_id):
+    """(document_id, rank) query for documents holding every term, from DocumentTerm
+
+    Phrases and prefixes degrade to plain terms that may sit on different pages.
+    """
+    terms = list(dict.fromkeys(term for clause_terms, _ in clauses for term in clause_terms))
+    
+    # Served by the (user_id, term, document_id) index, without touching other tenants' postings
+    return db.session.query(
+        DocumentTerm.document_id.label('document_id'),
+        func.sum(DocumentTerm.occurrences).label('rank')
+    ).filter(
+        DocumentTerm.user_id == user_id,
+        DocumentTerm.term.in_(terms)
+    ).group_by(
+        DocumentTerm.document_id
+    ).having(
+        func.count(func.distinct(DocumentTerm.term)) == len(terms)
+    ), terms
+
+def matching_document_ids(search, user_id):
+    """Query of the ids of the user's documents whose contents match the search, or None"""
+    clauses = parse_search(search)
+    if not clauses:
+        return None
+    
+    if search_backend() == 'terms':
+        query, _ = _matching_postings(clauses, user_id)
+        return query.with_entities(DocumentTerm.document_id)
+    
+    pages = _matching_pages(clauses, user_id)
+    return db.session.query(pages.c.document_id).distinct()
+
+def search_documents(search, user_id, limit=20, offset=0):
+    """Return ranked [{'document_id', 'rank', 'pages'}] for documents matching the search"""
+    clauses = parse_search(search)
+    if not clauses:
+        return []
+    
+    if search_backend() == 'terms':
+        query, terms = _matching_postings(clauses, user_id)
+        rank = func.sum(DocumentTerm.occurrences)
+        ranked = query.order_by(rank.desc(), DocumentTerm.document_id).limit(limit).offset(offset).all()
+        if not ranked:
+            return []
+        
+        # Page hits only for the returned documents
+        page_rows = db.session.query(
+            DocumentTerm.document_id,
+            DocumentTerm.page_number
+        ).filter(
+            DocumentTerm.user_id == user_id,
+            DocumentTerm.term.in_(terms),
+            DocumentTerm.document_id.in_([row.document_id for row in ranked])
+        ).distinct().all()
+    else:
+        pages_query = _matching_pages(clauses, user_id)
+        rank = func.sum(pages_query.c.rank)
+        ranked = db.session.query(
+            pages_query.c.document_id,
+            rank.label('rank')
+        ).group_by(
+            pages_query.c.document_id
+        ).order_by(rank.desc(), pages_query.c.document_id).limit(limit).offset(offset).all()
+        if not ranked:
+            return []
+        
+        page_rows = db.session.query(
+            pages_query.c.document_id,
+            pages_query.c.page_number
+        ).filter(
+            pages_query.c.document_id.in_([row.document_id for row in ranked])
+        ).distinct().all()
+    
+    pages = {}
+    for document_id, page_number in page_rows:
+        pages.setdefault(document_id, []).append(page_number)
+    
+    return [
+        {
+            'document_id': row.document_id,
+            'rank': float(row.rank),
+            'pages': sorted(pages.get(row.document_id, []))
+        }
+        for row in ranked
+    ]
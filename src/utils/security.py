@@ -5,15 +5,20 @@ import time
 from datetime import datetime
 import requests
 from flask import current_app
+from src.utils.hashing import sha256_file, stored_file_hash
 
 def calculate_sha256(file_path):
-    """Calculate SHA-256 hash of a file"""
+    """Calculate SHA-256 hash of a local file"""
     try:
-        hash_sha256 = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_sha256.update(chunk)
-        return hash_sha256.hexdigest()
+        return sha256_file(file_path)
+    except Exception as e:
+        current_app.logger.error(f"Error calculating SHA-256: {str(e)}")
+        return None
+
+def calculate_stored_sha256(key, use_cache=False):
+    """Calculate SHA-256 hash of a file in document storage; ``use_cache`` trusts a digest cached for unchanged metadata"""
+    try:
+        return stored_file_hash(key, use_cache=use_cache)
     except Exception as e:
         current_app.logger.error(f"Error calculating SHA-256: {str(e)}")
         return None
@@ -0,0 +1,330 @@
+import mimetypes
+import os
+import posixpath
+import shutil
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from flask import Response, current_app, request, send_file
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # Only needed for STORAGE_BACKEND=s3
+    boto3 = None
+
+STREAM_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+_storage = None
+_storage_lock = threading.Lock()
+
+class StorageBackend:
+    """Where document files live, addressed by string keys
+
+    Reads and writes are streamed. PDF processing that needs a seekable local
+    file goes through ``local_copy``, which is free on the local backend.
+    """
+
+    def join(self, *parts):
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def size(self, key):
+        raise NotImplementedError
+
+    def stat(self, key):
+        """Return (size, modification time in nanoseconds) of a stored file"""
+        raise NotImplementedError
+
+    def open(self, key):
+        """Return a binary stream of the stored file"""
+        raise NotImplementedError
+
+    def read_range(self, key, start, length):
+        """Return up to length bytes of the stored file from offset start"""
+        raise NotImplementedError
+
+    def save(self, stream, key):
+        """Write a binary stream to key, replacing it atomically"""
+        raise NotImplementedError
+
+    def save_file(self, local_path, key):
+        """Move a local file to key"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def rename(self, key, new_key):
+        raise NotImplementedError
+
+    def touch(self, key):
+        """Refresh the modification time of a stored file"""
+        raise NotImplementedError
+
+    def list(self, prefix):
+        """Yield (key, modified timestamp) of the files under prefix"""
+        raise NotImplementedError
+
+    @contextmanager
+    def local_copy(self, key):
+        """Yield a local path holding the file for the duration of the block"""
+        raise NotImplementedError
+
+    def send(self, key, mimetype=None, as_attachment=False, download_name=None, etag=None, last_modified=None):
+        """Stream the file as a response, with conditional and Range support"""
+        raise NotImplementedError
+
+class LocalStorage(StorageBackend):
+    """Files on a local or shared filesystem; keys are filesystem paths"""
+
+    def join(self, *parts):
+        return os.path.join(*parts)
+
+    def exists(self, key):
+        return os.path.exists(key)
+
+    def size(self, key):
+        return os.path.getsize(key)
+
+    def stat(self, key):
+        stat_result = os.stat(key)
+        return stat_result.st_size, stat_result.st_mtime_ns
+
+    def open(self, key):
+        return open(key, 'rb', buffering=STREAM_CHUNK_SIZE)
+
+    def read_range(self, key, start, length):
+        file_descriptor = os.open(key, os.O_RDONLY)
+        try:
+            return os.pread(file_descriptor, length, start)
+        finally:
+            os.close(file_descriptor)
+
+    def save(self, stream, key):
+        os.makedirs(os.path.dirname(key) or '.', exist_ok=True)
+        temp_path = f"{key}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, 'wb') as output_file:
+                shutil.copyfileobj(stream, output_file, STREAM_CHUNK_SIZE)
+            os.replace(temp_path, key)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def save_file(self, local_path, key):
+        os.makedirs(os.path.dirname(key) or '.', exist_ok=True)
+        try:
+            os.replace(local_path, key)
+        except OSError:
+            # Different filesystem: copy next to the target, then rename atomically
+            with open(local_path, 'rb') as source:
+                self.save(source, key)
+            os.remove(local_path)
+
+    def delete(self, key):
+        try:
+            os.remove(key)
+        except FileNotFoundError:
+            pass
+
+    def rename(self, key, new_key):
+        os.replace(key, new_key)
+
+    def touch(self, key):
+        os.utime(key)
+
+    def list(self, prefix):
+        for directory, _, filenames in os.walk(prefix):
+            for filename in filenames:
+                key = os.path.join(directory, filename)
+                try:
+                    yield key, os.path.getmtime(key)
+                except FileNotFoundError:
+                    continue
+
+    @contextmanager
+    def local_copy(self, key):
+        yield key
+
+    def send(self, key, mimetype=None, as_attachment=False, download_name=None, etag=None, last_modified=None):
+        # conditional=True makes Werkzeug answer Range and If-Range requests with 206
+        return send_file(
+            key,
+            mimetype=mimetype,
+            as_attachment=as_attachment,
+            download_name=download_name,
+            etag=etag or True,
+            last_modified=last_modified,
+            conditional=True
+        )
+
+class S3Storage(StorageBackend):
+    """Files in an S3-compatible bucket (AWS S3, MinIO, ...); keys are object keys"""
+
+    def __init__(self, bucket, endpoint_url=None, region=None, access_key=None, secret_key=None):
+        if boto3 is None:
+            raise RuntimeError("boto3 is required for STORAGE_BACKEND=s3")
+        self.bucket = bucket
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            # Path-style addressing works with MinIO and other self-hosted endpoints
+            config=BotoConfig(s3={'addressing_style': 'path'} if endpoint_url else {})
+        )
+
+    def join(self, *parts):
+        return posixpath.join(*parts)
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(key)
+        return head['ContentLength']
+
+    def stat(self, key):
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(key)
+        return head['ContentLength'], int(head['LastModified'].timestamp() * 1_000_000_000)
+
+    def open(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(key)
+
+    def read_range(self, key, start, length):
+        if length <= 0:
+            return b''
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes={start}-{start + length - 1}")['Body']
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(key)
+        except ClientError as e:
+            # Asking for bytes past the end of the object
+            if e.response.get('Error', {}).get('Code') == 'InvalidRange':
+                return b''
+            raise
+        with body:
+            return body.read()
+
+    def save(self, stream, key):
+        # Multipart upload in chunks; the object only appears once complete
+        self.client.upload_fileobj(stream, self.bucket, key)
+
+    def save_file(self, local_path, key):
+        self.client.upload_file(local_path, self.bucket, key)
+        os.remove(local_path)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def rename(self, key, new_key):
+        self.client.copy_object(Bucket=self.bucket, Key=new_key, CopySource={'Bucket': self.bucket, 'Key': key})
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def touch(self, key):
+        # Copying an object onto itself with new metadata updates LastModified
+        self.client.copy_object(
+            Bucket=self.bucket, Key=key,
+            CopySource={'Bucket': self.bucket, 'Key': key},
+            MetadataDirective='REPLACE'
+        )
+
+    def list(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix.rstrip('/') + '/'):
+            for obj in page.get('Contents', []):
+                yield obj['Key'], obj['LastModified'].timestamp()
+
+    @contextmanager
+    def local_copy(self, key):
+        suffix = posixpath.splitext(key)[1]
+        file_descriptor, temp_path = tempfile.mkstemp(suffix=suffix, prefix='zeropapel-')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as temp_file:
+                self.client.download_fileobj(self.bucket, key, temp_file)
+            yield temp_path
+        finally:
+            os.remove(temp_path)
+
+    def send(self, key, mimetype=None, as_attachment=False, download_name=None, etag=None, last_modified=None):
+        size = self.size(key)
+        status = 200
+        get_kwargs = {'Bucket': self.bucket, 'Key': key}
+        content_range = None
+
+        # Serve a single byte range straight from the bucket, unless If-Range no longer matches
+        byte_range = request.range.range_for_length(size) if request.range and request.range.units == 'bytes' else None
+        if byte_range and request.if_range.etag and request.if_range.etag != etag:
+            byte_range = None
+        if byte_range and request.if_range.date and (not last_modified or last_modified.replace(microsecond=0) > request.if_range.date.replace(tzinfo=None)):
+            byte_range = None
+        if byte_range:
+            start, stop = byte_range
+            get_kwargs['Range'] = f"bytes={start}-{stop - 1}"
+            content_range = (start, stop, size)
+            status = 206
+
+        body = self.client.get_object(**get_kwargs)['Body']
+        mimetype = mimetype or mimetypes.guess_type(download_name or key)[0] or 'application/octet-stream'
+        response = Response(body.iter_chunks(STREAM_CHUNK_SIZE), status=status, mimetype=mimetype)
+        response.content_length = content_range[1] - content_range[0] if content_range else size
+        if content_range:
+            response.headers['Content-Range'] = f"bytes {content_range[0]}-{content_range[1] - 1}/{size}"
+        response.accept_ranges = 'bytes'
+        if etag:
+            response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+        if download_name:
+            disposition = 'attachment' if as_attachment else 'inline'
+            response.headers.set('Content-Disposition', disposition, filename=download_name)
+        response.call_on_close(body.close)
+        return response
+
+def get_storage():
+    """Return the storage backend selected by STORAGE_BACKEND (local or s3)"""
+    global _storage
+
+    with _storage_lock:
+        if _storage is None:
+            backend = current_app.config.get('STORAGE_BACKEND', 'local')
+            if backend == 's3':
+                _storage = S3Storage(
+                    current_app.config['S3_BUCKET'],
+                    endpoint_url=current_app.config.get('S3_ENDPOINT_URL'),
+                    region=current_app.config.get('S3_REGION'),
+                    access_key=current_app.config.get('S3_ACCESS_KEY_ID'),
+                    secret_key=current_app.config.get('S3_SECRET_ACCESS_KEY')
+                )
+            elif backend == 'local':
+                _storage = LocalStorage()
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+        return _storage
+
+def reset_storage():
+    """Drop the configured backend so the next call reads the configuration again"""
+    global _storage
+    with _storage_lock:
+        _storage = None
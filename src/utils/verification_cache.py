@@ -0,0 +1,73 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+# Documents whose verification result is kept in memory per worker process
+MAX_CACHED_VERIFICATIONS = 1024
+
+REDIS_KEY_PREFIX = 'zeropapel:verification'
+
+# document id -> (verification version, expiry on the monotonic clock, result)
+_results = OrderedDict()
+_results_lock = threading.Lock()
+
+_redis = None
+_redis_lock = threading.Lock()
+
+def _get_redis():
+    global _redis
+
+    with _redis_lock:
+        if _redis is None:
+            import redis
+            _redis = redis.Redis.from_url(current_app.config.get('REDIS_URL'))
+        return _redis
+
+def _uses_redis():
+    """VERIFY_CACHE_BACKEND: 'memory' caches per worker process, 'redis' shares results through REDIS_URL"""
+    return current_app.config.get('VERIFY_CACHE_BACKEND', 'memory') == 'redis'
+
+def _redis_key(document_id, version):
+    return f"{REDIS_KEY_PREFIX}:{document_id}:{version}"
+
+def get_cached_verification(document_id, version):
+    """Return the cached result for this verification version of the document, or None"""
+    if _uses_redis():
+        try:
+            cached = _get_redis().get(_redis_key(document_id, version))
+        except Exception as e:
+            current_app.logger.warning(f"Could not read cached verification of document {document_id}: {str(e)}")
+            return None
+        return json.loads(cached) if cached is not None else None
+
+    with _results_lock:
+        cached = _results.get(document_id)
+        if cached is None:
+            return None
+        if cached[0] != version or cached[1] < time.monotonic():
+            del _results[document_id]
+            return None
+        _results.move_to_end(document_id)
+        return cached[2]
+
+def cache_verification(document_id, version, result):
+    """Keep a result for VERIFY_CACHE_TTL seconds, so bit rot under an unchanged version still surfaces"""
+    ttl = current_app.config.get('VERIFY_CACHE_TTL', 300)
+    if ttl <= 0:
+        return
+
+    if _uses_redis():
+        # Older versions are not deleted; they are never asked for again and expire with the TTL
+        try:
+            _get_redis().setex(_redis_key(document_id, version), ttl, json.dumps(result))
+        except Exception as e:
+            current_app.logger.warning(f"Could not cache verification of document {document_id}: {str(e)}")
+        return
+
+    with _results_lock:
+        _results[document_id] = (version, time.monotonic() + ttl, result)
+        _results.move_to_end(document_id)
+        while len(_results) > MAX_CACHED_VERIFICATIONS:
+            _results.popitem(last=False)